@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+CACHE_KEY = 'auth:token:{}'
+GENERATION_KEY = '{}:generation'
+
+User = get_user_model()
+
+
+class TokenCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, snapshot):
+        with self.lock:
+            self.entries[key] = (
+                monotonic() + settings.AUTH_TOKEN_CACHE_TIMEOUT,
+                snapshot,
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+token_cache = TokenCache()
+
+
+def get_cache_key(key):
+    return CACHE_KEY.format(sha256(key.encode()).hexdigest())
+
+
+def get_generation(cache_key):
+    key = GENERATION_KEY.format(cache_key)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid4().hex, None)
+        return cache.get(key)
+    return generation
+
+
+def invalidate_token(key):
+    cache_key = get_cache_key(key)
+    cache.delete_many([cache_key, GENERATION_KEY.format(cache_key)])
+    token_cache.delete(cache_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        if not settings.AUTH_TOKEN_CACHE_TIMEOUT:
+            return super().authenticate_credentials(key)
+        cache_key = get_cache_key(key)
+        generation = get_generation(cache_key)
+        snapshot = token_cache.get(cache_key)
+        if snapshot is None and settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT:
+            snapshot = cache.get(cache_key)
+            if snapshot is not None:
+                token_cache.set(cache_key, snapshot)
+        if snapshot is None or generation is None or (
+            snapshot[0] != generation
+        ):
+            user, token = super().authenticate_credentials(key)
+            snapshot = self.make_snapshot(generation, token)
+            token_cache.set(cache_key, snapshot)
+            if settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT:
+                cache.set(
+                    cache_key,
+                    snapshot,
+                    settings.AUTH_TOKEN_SHARED_CACHE_TIMEOUT,
+                )
+            return user, token
+        return self.restore(snapshot)
+
+    def make_snapshot(self, generation, token):
+        user = token.user
+        return (
+            generation,
+            token.key,
+            token.created,
+            user._state.db,
+            [getattr(user, field.attname)
+             for field in User._meta.concrete_fields],
+        )
+
+    def restore(self, snapshot):
+        _, key, created, db, values = snapshot
+        user = User.from_db(
+            db,
+            [field.attname for field in User._meta.concrete_fields],
+            values,
+        )
+        token = self.get_model()(key=key, user=user, created=created)
+        return user, token
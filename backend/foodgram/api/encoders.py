@@ -0,0 +1,10 @@
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+default = JSONEncoder().default
+
+
+def encode_orjson(data):
+    return orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
@@ -0,0 +1,117 @@
+import csv
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Func
+from django.http import StreamingHttpResponse
+from recipes.models import ShoppingTotal
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+SHOPPING_LIST_TITLE = 'Cписок покупок: '
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+ITERATOR_CHUNK_SIZE = 500
+
+
+class BinaryOrder(Func):
+    template = '%(expressions)s'
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template='%(expressions)s COLLATE "C"',
+            **extra_context,
+        )
+
+
+def get_shopping_list(user):
+    return ShoppingTotal.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by(
+        BinaryOrder('ingredient__name'),
+        BinaryOrder('ingredient__measurement_unit'),
+    ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def export_txt(rows):
+    yield f'{SHOPPING_LIST_TITLE}\n'
+    for index, (name, unit, amount) in enumerate(rows, start=1):
+        yield f'{index}. {name.capitalize()} ({unit}) - {amount};\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for name, unit, amount in rows:
+        yield writer.writerow((name.capitalize(), unit, amount))
+
+
+def export_json(rows):
+    separator = ''
+    yield '['
+    for name, unit, amount in rows:
+        item = json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': amount},
+            ensure_ascii=False,
+        )
+        yield f'{separator}{item}'
+        separator = ','
+    yield ']'
+
+
+def export_pdf(rows):
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+        )
+    buffer = BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    position = height - PDF_MARGIN
+    for line in export_txt(rows):
+        if position < PDF_MARGIN:
+            page.showPage()
+            position = height - PDF_MARGIN
+        page.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        page.drawString(PDF_MARGIN, position, line.rstrip('\n'))
+        position -= PDF_LINE_HEIGHT
+    page.save()
+    yield buffer.getvalue()
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain'),
+    'csv': (export_csv, 'text/csv'),
+    'json': (export_json, 'application/json'),
+    'pdf': (export_pdf, 'application/pdf'),
+}
+
+
+def shopping_list_response(request, export_format):
+    exporter, content_type = EXPORTERS[export_format]
+    rows = get_shopping_list(request.user)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        # ASGI читает потоковый ответ в цикле событий, где ORM недоступен.
+        rows = list(rows)
+    response = StreamingHttpResponse(
+        exporter(rows),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping-list.{export_format}"'
+    )
+    return response
@@ -0,0 +1,170 @@
+from collections import defaultdict
+from operator import attrgetter
+
+from foodgram.concurrency import gather
+from recipes.cache import get_reference
+from recipes.memberships import get_memberships
+from recipes.models import IngredientRecipe, TagRecipe
+from rest_framework.utils.serializer_helpers import ReturnList
+
+from .serializers import (IngredientSerializer, RecipeNestedSerializer,
+                          RecipeViewSerializer, SubscribeSerializer,
+                          TagSerializer)
+
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+IMAGE_FIELDS = {'image', 'image_thumb'}
+
+
+class FastSerializer:
+    fields = ()
+    sources = {}
+
+    def __init__(self, instance=None, many=True, context=None):
+        self.instance = instance
+        self.context = context or {}
+        self.request = self.context.get('request')
+
+    def get_accessors(self):
+        selected = self.context.get('fields')
+        return [
+            (
+                name,
+                getattr(self, f'get_{name}', None)
+                or attrgetter(self.sources.get(name, name)),
+            )
+            for name in self.fields
+            if selected is None or name in selected
+        ]
+
+    def prepare(self, objs, names):
+        pass
+
+    @property
+    def data(self):
+        objs = list(self.instance)
+        accessors = self.get_accessors()
+        self.prepare(objs, {name for name, _ in accessors})
+        return ReturnList(
+            [{name: get(obj) for name, get in accessors} for obj in objs],
+            serializer=self,
+        )
+
+    def get_url(self, file):
+        if not file:
+            return None
+        if self.request is None:
+            return file.url
+        return self.request.build_absolute_uri(file.url)
+
+
+class TagFastSerializer(FastSerializer):
+    fields = TagSerializer.Meta.fields
+
+
+class IngredientFastSerializer(FastSerializer):
+    fields = IngredientSerializer.Meta.fields
+
+
+class RecipeFastSerializer(FastSerializer):
+    fields = RecipeViewSerializer.Meta.fields
+
+    def prepare(self, objs, names):
+        loaders = {
+            'tags': self.load_tags,
+            'ingredients': self.load_ingredients,
+        }
+        self.memberships = get_memberships(self.request)
+        names = [name for name in loaders if name in names]
+        self.related = dict(zip(names, gather(*(
+            lambda loader=loaders[name]: loader(objs) for name in names
+        ))))
+
+    def load_tags(self, objs):
+        rows = list(TagRecipe.objects.filter(
+            recipe_id__in=[obj.pk for obj in objs]
+        ).order_by('tag_id').values_list('recipe_id', 'tag_id'))
+        tags = {
+            pk: {
+                name: getattr(tag, name)
+                for name in TagSerializer.Meta.fields
+            }
+            for pk, tag in get_reference(
+                'tags', {tag_id for _, tag_id in rows}
+            ).items()
+        }
+        result = defaultdict(list)
+        for recipe_id, tag_id in rows:
+            if tag_id in tags:
+                result[recipe_id].append(tags[tag_id])
+        return result
+
+    def load_ingredients(self, objs):
+        rows = list(IngredientRecipe.objects.filter(
+            recipe_id__in=[obj.pk for obj in objs]
+        ).order_by('pk').values_list('recipe_id', 'ingredient_id', 'amount'))
+        ingredients = get_reference(
+            'ingredients', {ingredient_id for _, ingredient_id, _ in rows}
+        )
+        result = defaultdict(list)
+        for recipe_id, ingredient_id, amount in rows:
+            ingredient = ingredients.get(ingredient_id)
+            if ingredient is None:
+                continue
+            result[recipe_id].append({
+                'id': ingredient_id,
+                'name': ingredient.name,
+                'measurement_unit': ingredient.measurement_unit,
+                'amount': amount,
+            })
+        return result
+
+    def get_tags(self, obj):
+        return self.related['tags'].get(obj.pk, [])
+
+    def get_author(self, obj):
+        author = {name: getattr(obj.author, name) for name in AUTHOR_FIELDS}
+        author['is_subscribed'] = obj.author_id in self.memberships['follows']
+        return author
+
+    def get_ingredients(self, obj):
+        return self.related['ingredients'].get(obj.pk, [])
+
+    def get_is_favorited(self, obj):
+        return obj.pk in self.memberships['favorites']
+
+    def get_is_in_shopping_cart(self, obj):
+        return obj.pk in self.memberships['cart']
+
+    def get_image(self, obj):
+        return self.get_url(obj.image)
+
+    def get_image_thumb(self, obj):
+        return self.get_url(obj.image_thumb)
+
+
+class SubscriptionFastSerializer(FastSerializer):
+    fields = tuple(
+        name for name in SubscribeSerializer.Meta.fields
+        if name not in ('user', 'author')
+    )
+    sources = {
+        name: f'author.{name}' for name in AUTHOR_FIELDS
+    }
+
+    def get_is_subscribed(self, obj):
+        return True
+
+    def get_recipes(self, obj):
+        return [
+            {
+                name: (
+                    self.get_url(getattr(recipe, name))
+                    if name in IMAGE_FIELDS else getattr(recipe, name)
+                )
+                for name in RecipeNestedSerializer.Meta.fields
+            }
+            for recipe in self.context['recipes'].get(obj.author_id, [])
+        ]
+
+    def get_recipes_count(self, obj):
+        return obj.author.recipes_count
@@ -1,19 +1,64 @@
 import base64
+import binascii
+from hashlib import sha256
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
-from recipes.models import Tag
+from django.conf import settings
+from django.core.files import File
+from recipes.cache import get_reference
 from rest_framework import serializers
 
+DECODE_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_base64': 'Некорректное изображение в формате base64.',
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, ''.join(filter(str.isalnum, ext)))
         return super().to_internal_value(data)
 
+    def decode(self, imgstr, ext):
+        imgstr = ''.join(imgstr.split())
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(imgstr) // 4 * 3 > max_size:
+            self.fail('max_size', max_size=max_size)
+        file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        digest = sha256()
+        try:
+            for start in range(0, len(imgstr), DECODE_CHUNK_SIZE):
+                chunk = base64.b64decode(
+                    imgstr[start:start + DECODE_CHUNK_SIZE], validate=True
+                )
+                digest.update(chunk)
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return File(file, name=f'{digest.hexdigest()}.{ext}')
+
 
 class TagListField(serializers.ListField):
+    child = serializers.IntegerField()
+    default_error_messages = {
+        'does_not_exist': 'Теги не найдены: {pk_values}.',
+    }
+
     def to_internal_value(self, data):
-        return Tag.objects.in_bulk(data)
+        pks = super().to_internal_value(data)
+        tags = get_reference('tags', pks)
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in tags]
+        if missing:
+            self.fail(
+                'does_not_exist',
+                pk_values=', '.join(map(str, missing)),
+            )
+        return {pk: tags[pk] for pk in pks}
@@ -1,5 +1,22 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.validators import RegexValidator
+from django.db.models import (Case, Count, IntegerField, OuterRef, Subquery,
+                              Value, When)
 from django_filters import rest_framework
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.index import match_recipes
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.search import search_ingredients
+
+ORDERINGS = {
+    'popular': '-popularity',
+    'trending': '-trending_score',
+}
+
+
+class NumberInFilter(rest_framework.BaseInFilter, rest_framework.NumberFilter):
+    pass
 
 
 class RecipeAnonymousFilters(rest_framework.FilterSet):
@@ -8,22 +25,88 @@ class RecipeAnonymousFilters(rest_framework.FilterSet):
         queryset=Tag.objects.all(),
         to_field_name='slug',
     )
+    ingredients = NumberInFilter(method='filter_ingredients')
+    match = rest_framework.CharFilter(
+        method='filter_match',
+        validators=[RegexValidator(r'^(all|any|min:[1-9][0-9]*)$')],
+    )
+    ordering = rest_framework.ChoiceFilter(
+        choices=(('popular', 'popular'), ('trending', 'trending')),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags',)
 
+    def get_minimum(self, ingredient_ids):
+        match = self.form.cleaned_data.get('match') or 'all'
+        if match == 'all':
+            return len(ingredient_ids)
+        if match == 'any':
+            return 1
+        return int(match.split(':')[1])
+
+    def filter_ingredients(self, queryset, name, value):
+        ingredient_ids = list(dict.fromkeys(int(pk) for pk in value))
+        minimum = self.get_minimum(ingredient_ids)
+        coverage = match_recipes(ingredient_ids, minimum)
+        if (
+            coverage is None
+            or len(coverage) > settings.RECIPE_INDEX_MAX_RESULTS
+        ):
+            return self.filter_ingredients_in_db(
+                queryset, ingredient_ids, minimum
+            )
+        if not coverage:
+            return queryset.none()
+        groups = defaultdict(list)
+        for recipe_id, count in coverage.items():
+            groups[count].append(recipe_id)
+        return queryset.filter(pk__in=list(coverage)).annotate(
+            coverage=Case(
+                *[When(pk__in=recipe_ids, then=Value(count))
+                  for count, recipe_ids in groups.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        ).order_by('-coverage', *Recipe._meta.ordering, '-pk')
+
+    def filter_ingredients_in_db(self, queryset, ingredient_ids, minimum):
+        covered = IngredientRecipe.objects.filter(
+            ingredient_id__in=ingredient_ids
+        ).order_by().values('recipe_id').annotate(
+            coverage=Count('ingredient_id', distinct=True)
+        )
+        return queryset.filter(
+            pk__in=covered.filter(coverage__gte=minimum).values('recipe_id')
+        ).annotate(
+            coverage=Subquery(
+                covered.filter(recipe_id=OuterRef('pk')).values('coverage'),
+                output_field=IntegerField(),
+            )
+        ).order_by('-coverage', *Recipe._meta.ordering, '-pk')
+
+    def filter_match(self, queryset, name, value):
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        ranking = []
+        if 'coverage' in queryset.query.annotations:
+            ranking.append('-coverage')
+        return queryset.order_by(*ranking, ORDERINGS[value], '-pk')
+
 
 class IngredientFilter(rest_framework.FilterSet):
-    name = rest_framework.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith'
-    )
+    name = rest_framework.CharFilter(method='search')
 
     class Meta:
         model = Ingredient
         fields = ('name', 'measurement_unit')
 
+    def search(self, queryset, name, value):
+        return search_ingredients(queryset, value)
+
 
 class RecipeFilters(RecipeAnonymousFilters):
     is_favorited = rest_framework.BooleanFilter(
@@ -0,0 +1,179 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
+from foodgram.concurrency import fetch, gather
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 6
+    invalid_cursor_message = 'Неверный курсор.'
+    invalid_ordering_message = (
+        'Курсорная пагинация не поддерживает выбранную сортировку.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        results = fetch(
+            queryset.order_by(*self.ordering)[:self.page_size + 1]
+        )
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if not all(isinstance(field, str) for field in ordering):
+            raise ValidationError(self.invalid_ordering_message)
+        pk_names = {'pk', 'id', queryset.model._meta.pk.name}
+        if not ordering or ordering[-1].lstrip('-') not in pk_names:
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        self.fields = []
+        for name in ordering:
+            field_name = name.lstrip('-')
+            try:
+                field = (
+                    queryset.model._meta.pk if field_name == 'pk'
+                    else queryset.model._meta.get_field(field_name)
+                )
+            except FieldDoesNotExist:
+                raise ValidationError(self.invalid_ordering_message)
+            self.fields.append((field, name.startswith('-')))
+        return ordering
+
+    def get_position_filter(self, position):
+        position_filter = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.fields, position):
+            lookup = 'lt' if descending else 'gt'
+            position_filter |= equal & Q(
+                **{f'{field.attname}__{lookup}': value}
+            )
+            equal &= Q(**{field.attname: value})
+        return position_filter
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [
+                field.to_python(value)
+                for (field, _), value in zip(self.fields, values)
+            ]
+        except (BinasciiError, DjangoValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field, _ in self.fields]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1]),
+        )
+
+
+class LimitPagination(BasePagination):
+    limit_query_param = 'limit'
+    default_limit = 100
+    max_limit = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            limit = _positive_int(
+                request.query_params[self.limit_query_param],
+                strict=True,
+                cutoff=self.max_limit,
+            )
+        except (KeyError, ValueError):
+            limit = self.default_limit
+        return list(queryset[:limit])
+
+    def get_paginated_response(self, data):
+        return Response(data)
+
+
+class ConcurrentPaginator(Paginator):
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        bottom = (number - 1) * self.per_page
+        objects, _ = gather(
+            lambda: fetch(self.object_list[bottom:bottom + self.per_page]),
+            lambda: self.count,
+        )
+        return self._get_page(objects, self.validate_number(number), self)
+
+
+class CustomPagination(PageNumberPagination):
+    page_size_query_param = 'limit'
+    page_size = 6
+
+    def django_paginator_class(self, object_list, per_page):
+        return ConcurrentPaginator(
+            object_list, per_page, count=self.object_count
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        self.object_count = getattr(view, 'object_count', None)
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from recipes.cache import get_reference
+from recipes.images import schedule_image_processing
+from recipes.memberships import get_memberships
 from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag, TagRecipe)
+                            Recipe, ShoppingCart, ShoppingTotal, Tag,
+                            TagRecipe)
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
@@ -10,15 +16,33 @@ from .fields import Base64ImageField, TagListField
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (AttributeError, KeyError, ValueError):
+        return None
+    return limit if limit >= 0 else None
+
+
+class SparseFieldsMixin:
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if selected is None or parent is not None:
+            return fields
+        return {
+            name: field for name, field in fields.items()
+            if name in selected or field.write_only
+        }
+
+
 class FieldCheckingMixin():
-    def get_is_field_action(self, request, model, data):
-        user = None
-        if request and hasattr(request, 'user'):
-            user = request.user
-        if not user:
-            return False
-        data.update({'user': user.id})
-        return model.objects.filter(**data).exists()
+    def get_is_member(self, kind, pk):
+        memberships = get_memberships(self.context.get('request'))
+        return pk in memberships[kind]
 
     def create_update_instance_recipe(self, recipe, ingredients, tags):
         obj_tag_recipe = []
@@ -40,10 +64,76 @@ class FieldCheckingMixin():
             )
         TagRecipe.objects.bulk_create(obj_tag_recipe)
 
-        return
+        recipe._prefetched_objects_cache = {
+            'recipes': obj_ingredient_recipe,
+            'tag': sorted(tags.values(), key=lambda tag: tag.pk),
+        }
+
+    def update_ingredients(self, recipe, ingredients):
+        submitted = {
+            data['ingredient']['id'].pk: data['amount']
+            for data in ingredients
+        }
+        stored = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        changes = {
+            ingredient_id: submitted.get(ingredient_id, 0) - row.amount
+            for ingredient_id, row in stored.items()
+        }
+        changed = []
+        for ingredient_id, row in stored.items():
+            amount = submitted.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        removed = stored.keys() - submitted.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        added = [
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=submitted[ingredient_id],
+            )
+            for ingredient_id in submitted.keys() - stored.keys()
+        ]
+        if added:
+            IngredientRecipe.objects.bulk_create(added)
+            changes.update((row.ingredient_id, row.amount) for row in added)
+        ShoppingTotal.recipe_changed(recipe.pk, changes)
+        if removed or added:
+            recipe.similar_stale = True
+
+    def update_tags(self, recipe, tags):
+        stored = set(
+            TagRecipe.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        removed = stored - tags.keys()
+        if removed:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        added = [
+            TagRecipe(recipe=recipe, tag_id=tag_id)
+            for tag_id in tags.keys() - stored
+        ]
+        if added:
+            TagRecipe.objects.bulk_create(added)
+        if removed or added:
+            recipe.similar_stale = True
 
 
-class CustomUserSerializer(UserSerializer, FieldCheckingMixin):
+class CustomUserSerializer(
+    SparseFieldsMixin, UserSerializer, FieldCheckingMixin
+):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -62,11 +152,9 @@ class CustomUserSerializer(UserSerializer, FieldCheckingMixin):
         }
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        data = {
-            'author': obj.id
-        }
-        return self.get_is_field_action(request, Follow, data)
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return self.get_is_member('follows', obj.id)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -98,10 +186,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient.id'
-    )
+    id = serializers.IntegerField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit'
@@ -120,7 +205,9 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         return value
 
 
-class RecipeViewSerializer(serializers.ModelSerializer, FieldCheckingMixin):
+class RecipeViewSerializer(
+    SparseFieldsMixin, serializers.ModelSerializer, FieldCheckingMixin
+):
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True, source='tag')
     ingredients = serializers.SerializerMethodField(
@@ -135,6 +222,7 @@ class RecipeViewSerializer(serializers.ModelSerializer, FieldCheckingMixin):
         read_only=True,
         source='get_is_in_shopping_cart'
     )
+    image_thumb = serializers.ImageField(read_only=True, use_url=True)
 
     class Meta:
         model = Recipe
@@ -147,27 +235,23 @@ class RecipeViewSerializer(serializers.ModelSerializer, FieldCheckingMixin):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumb',
             'text',
             'cooking_time'
         )
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        data = {
-            'recipe': obj.id
-        }
-        return self.get_is_field_action(request, ShoppingCart, data)
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return self.get_is_member('cart', obj.id)
 
     def get_ingredients(self, obj):
-        ingredients = IngredientRecipe.objects.filter(recipe=obj)
-        return IngredientInRecipeSerializer(ingredients, many=True).data
+        return IngredientInRecipeSerializer(obj.recipes.all(), many=True).data
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        data = {
-            'recipe': obj.id
-        }
-        return self.get_is_field_action(request, Favorite, data)
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return self.get_is_member('favorites', obj.id)
 
 
 class RecipeSerializer(serializers.ModelSerializer, FieldCheckingMixin):
@@ -201,20 +285,29 @@ class RecipeSerializer(serializers.ModelSerializer, FieldCheckingMixin):
         recipe = Recipe.objects.create(**validated_data)
 
         self.create_update_instance_recipe(recipe, ingredients, tags)
+        if recipe.image:
+            schedule_image_processing(recipe)
 
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
+        recipe.author.is_subscribed = False
         return recipe
 
     def update(self, instance, validated_data):
-
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-
-        TagRecipe.objects.filter(recipe=instance).delete()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-
-        self.create_update_instance_recipe(instance, ingredients, tags)
-
-        return super().update(instance, validated_data)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+
+        with transaction.atomic():
+            if ingredients is not None:
+                self.update_ingredients(instance, ingredients)
+            if tags is not None:
+                self.update_tags(instance, tags)
+
+            if validated_data.get('image'):
+                instance.image_thumb = None
+            instance = super().update(instance, validated_data)
+            if validated_data.get('image'):
+                schedule_image_processing(instance)
+        return instance
 
     def validate_ingredients(self, value):
 
@@ -226,13 +319,26 @@ class RecipeSerializer(serializers.ModelSerializer, FieldCheckingMixin):
                 'Для одного блюда указывать более одного'
                 'раза один и тот же ингредиент - недопустимо'
             )
+        ingredients = get_reference('ingredients', unique_id)
+        missing = [pk for pk in unique_id if pk not in ingredients]
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, missing))
+                )
+            )
+        for v in value:
+            v['ingredient']['id'] = ingredients[v['ingredient']['id']]
 
         return value
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        if not hasattr(instance, 'is_favorited'):
+            instance = Recipe.objects.with_related().get(pk=instance.pk)
         return RecipeViewSerializer(
             instance,
-            context={'request': self.context.get('request')}
+            context={'request': request}
         ).data
 
 
@@ -243,12 +349,14 @@ class RecipeNestedSerializer(serializers.ModelSerializer):
         required=False,
     )
 
+    image_thumb = serializers.ImageField(read_only=True, use_url=True)
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_thumb', 'cooking_time')
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
+class SubscribeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
     username = serializers.ReadOnlyField(source='author.username')
@@ -285,7 +393,13 @@ class SubscribeSerializer(serializers.ModelSerializer):
         ]
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj.author)
+        recipes = self.context.get('recipes')
+        if recipes is not None:
+            queryset = recipes.get(obj.author_id, [])
+        else:
+            queryset = Recipe.objects.filter(author=obj.author)[
+                :get_recipes_limit(self.context.get('request'))
+            ]
         serializer = RecipeNestedSerializer(
             queryset,
             many=True,
@@ -294,7 +408,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
         return True
@@ -353,3 +467,11 @@ class ShoppingCartSerializer(FavoriteShoppingCartSerializer):
         model = ShoppingCart
         fields = FavoriteShoppingCartSerializer.Meta.fields
         extra_kwargs = FavoriteShoppingCartSerializer.Meta.extra_kwargs
+
+
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE,
+    )
@@ -0,0 +1,864 @@
+import base64
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from api.authentication import TokenCache
+from api.fields import Base64ImageField
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from foodgram.instrumentation import assert_query_budget, registry
+from recipes.index import RecipeIngredientIndex
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingTotal, Tag, TagRecipe)
+from recipes.signals import fill_counters, rebuild_shopping_totals
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+RECIPES = 12
+LIST_QUERIES = 5
+ANONYMOUS_LIST_QUERIES = 4
+DETAIL_QUERIES = 5
+GIF = base64.b64decode(
+    'R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+)
+
+
+@override_settings(CONCURRENT_FETCH_WORKERS=0)
+class RecipeDataTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='password',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            first_name='Читатель',
+            last_name='Рецептов',
+            password='password',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}',
+                color=f'#00000{number}',
+                slug=f'tag-{number}',
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(5)
+        ]
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f'Рецепт {number}',
+                text='Смешать и подать.',
+                cooking_time=number + 1,
+            )
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe=recipe, tag=tag) for tag in tags
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.reader, recipe=recipe)
+            if number % 3:
+                ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.recipe = recipe
+        cls.tags = tags
+        cls.ingredients = ingredients
+
+
+class RecipeQueryCountTests(RecipeDataTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get_counted(self, client, path, number):
+        client.get(path)
+        with self.assertNumQueries(number):
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for fast in (True, False):
+            for limit in (1, 6, RECIPES):
+                with self.subTest(fast=fast, limit=limit), override_settings(
+                    FAST_SERIALIZERS=fast
+                ):
+                    data = self.get_counted(
+                        self.client,
+                        f'/api/recipes/?limit={limit}',
+                        LIST_QUERIES,
+                    )
+                    self.assertEqual(len(data['results']), limit)
+                    recipe = data['results'][0]
+                    self.assertEqual(len(recipe['tags']), 3)
+                    self.assertEqual(len(recipe['ingredients']), 5)
+                    self.assertTrue(recipe['author']['is_subscribed'])
+
+    def test_anonymous_list_queries(self):
+        data = self.get_counted(
+            APIClient(), f'/api/recipes/?limit={RECIPES}',
+            ANONYMOUS_LIST_QUERIES,
+        )
+        self.assertEqual(len(data['results']), RECIPES)
+        self.assertFalse(any(
+            recipe['is_favorited'] or recipe['author']['is_subscribed']
+            for recipe in data['results']
+        ))
+
+    def test_detail_queries(self):
+        data = self.get_counted(
+            self.client, f'/api/recipes/{self.recipe.pk}/', DETAIL_QUERIES
+        )
+        self.assertTrue(data['is_favorited'])
+        self.assertTrue(data['is_in_shopping_cart'])
+        self.assertEqual(len(data['ingredients']), 5)
+
+
+class QueryBudgetTests(RecipeDataTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        token = Token.objects.create(user=self.reader)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def get_within_budget(self, path):
+        for attempt in ('cold', 'warm'):
+            with self.subTest(path=path, cache=attempt):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                assert_query_budget(response)
+
+    def test_read_endpoints_within_budget(self):
+        for path in (
+            f'/api/recipes/?limit={RECIPES}',
+            f'/api/recipes/{self.recipe.pk}/',
+            '/api/recipes/feed/',
+            '/api/recipes/download_shopping_cart/',
+            '/api/users/subscriptions/',
+            '/api/tags/',
+            '/api/ingredients/?name=Ингр',
+        ):
+            cache.clear()
+            self.get_within_budget(path)
+
+    def test_budget_violation_is_reported(self):
+        response = self.client.get('/api/tags/')
+        with self.assertRaises(AssertionError):
+            assert_query_budget(response, budget=0)
+
+
+@override_settings(
+    RECIPE_INDEX_SYNC_SECONDS=0, RECIPE_INDEX_BACKGROUND_BUILD=False
+)
+class IngredientFilterTests(RecipeDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = list(Recipe.objects.order_by('pk'))
+        for number, recipe in enumerate(recipes):
+            IngredientRecipe.objects.filter(
+                recipe=recipe,
+                ingredient__in=[
+                    ingredient
+                    for position, ingredient in enumerate(cls.ingredients)
+                    if (number + position) % 3 == 0
+                ],
+            ).delete()
+        cls.rare_tag = Tag.objects.create(
+            name='Редкий тег', color='#123456', slug='rare'
+        )
+        for recipe in recipes[:3]:
+            TagRecipe.objects.create(recipe=recipe, tag=cls.rare_tag)
+
+    def setUp(self):
+        patcher = mock.patch('recipes.index.index', RecipeIngredientIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?limit={RECIPES}&{query}')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        ids = [recipe['id'] for recipe in data['results']]
+        self.assertEqual(data['count'], len(ids))
+        return ids
+
+    def ingredient_ids(self, *positions):
+        return ','.join(str(self.ingredients[n].pk) for n in positions)
+
+    def test_index_and_database_agree(self):
+        for query in (
+            f'ingredients={self.ingredient_ids(0)}',
+            f'ingredients={self.ingredient_ids(0, 1)}',
+            f'ingredients={self.ingredient_ids(0, 1, 2)}&match=any',
+            f'ingredients={self.ingredient_ids(0, 1, 2)}&match=min:2',
+            f'ingredients={self.ingredient_ids(1, 2)}&ordering=popular',
+        ):
+            with self.subTest(query=query):
+                ids = self.get_ids(query)
+                self.assertTrue(ids)
+                with override_settings(RECIPE_INDEX_MAX_RESULTS=0):
+                    self.assertEqual(self.get_ids(query), ids)
+
+    def test_large_matches_compose_with_other_filters(self):
+        query = (
+            f'ingredients={self.ingredient_ids(0, 1, 2)}&match=any'
+            f'&tags={self.rare_tag.slug}'
+        )
+        expected = self.get_ids(query)
+        self.assertEqual(len(expected), 3)
+        with override_settings(RECIPE_INDEX_MAX_RESULTS=2):
+            self.assertEqual(self.get_ids(query), expected)
+
+    def test_minimum_above_requested_ingredients(self):
+        for maximum in (0, 1000):
+            with self.subTest(maximum=maximum), override_settings(
+                RECIPE_INDEX_MAX_RESULTS=maximum
+            ):
+                self.assertEqual(self.get_ids(
+                    f'ingredients={self.ingredient_ids(0)}&match=min:5'
+                ), [])
+
+    @override_settings(RECIPE_INDEX_BACKGROUND_BUILD=True)
+    def test_index_is_built_off_the_request(self):
+        with mock.patch('recipes.index.threading.Thread') as thread:
+            ids = self.get_ids(f'ingredients={self.ingredient_ids(0)}')
+        self.assertTrue(ids)
+        thread.return_value.start.assert_called_once_with()
+
+
+class StaleReferenceTests(RecipeDataTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_with_references_unseen_by_this_worker(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        for fast in (True, False):
+            with self.subTest(fast=fast), override_settings(
+                FAST_SERIALIZERS=fast
+            ):
+                self.client.get('/api/recipes/')
+                tag = Tag.objects.create(
+                    name=f'Новый тег {fast}',
+                    color=f'#FFFFF{int(fast)}',
+                    slug=f'new-{fast}',
+                )
+                ingredient = Ingredient.objects.create(
+                    name=f'Новый ингредиент {fast}', measurement_unit='г'
+                )
+                TagRecipe.objects.create(recipe=self.recipe, tag=tag)
+                IngredientRecipe.objects.create(
+                    recipe=self.recipe, ingredient=ingredient, amount=1
+                )
+                response = self.client.get('/api/recipes/')
+                self.assertEqual(response.status_code, 200)
+                recipe, = [
+                    recipe for recipe in response.json()['results']
+                    if recipe['id'] == self.recipe.pk
+                ]
+                self.assertIn(tag.pk, [tag['id'] for tag in recipe['tags']])
+                self.assertIn(ingredient.name, [
+                    ingredient['name'] for ingredient in recipe['ingredients']
+                ])
+                self.assertEqual(self.client.get(path).status_code, 200)
+
+
+class StaleReferenceValidationTests(RecipeDataTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_write_accepts_references_unseen_by_this_worker(self):
+        self.client.get('/api/tags/')
+        self.client.get('/api/ingredients/')
+        tag = Tag.objects.create(name='Новый тег', color='#FFFFFF', slug='new')
+        ingredient = Ingredient.objects.create(
+            name='Новый ингредиент', measurement_unit='г'
+        )
+        self.assertEqual(
+            self.client.get(f'/api/tags/{tag.pk}/').status_code, 200
+        )
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [{'id': ingredient.pk, 'amount': 1}],
+            'tags': [tag.pk],
+            'name': 'Рецепт с новыми ссылками',
+            'text': 'Смешать и подать.',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_unknown_references_are_rejected(self):
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [{'id': 10 ** 6, 'amount': 1}],
+            'tags': [10 ** 6],
+            'name': 'Рецепт',
+            'text': 'Смешать и подать.',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'ingredients', 'tags'})
+
+
+class ShoppingTotalTests(RecipeDataTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def check_totals_match_carts(self):
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        self.assertEqual(ShoppingTotal.compare(user_ids), ([], [], []))
+
+    def get_shopping_list(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_totals_are_rebuilt_after_migrate(self):
+        ShoppingTotal.objects.all().delete()
+        rebuild_shopping_totals(sender=None, using=DEFAULT_DB_ALIAS)
+        self.check_totals_match_carts()
+        shopping_list = self.get_shopping_list()
+        for ingredient in self.ingredients:
+            self.assertIn(ingredient.name, shopping_list)
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.check_totals_match_carts()
+
+    def test_cart_add_and_remove(self):
+        recipe = Recipe.objects.exclude(shoppings__user=self.reader).first()
+        path = f'/api/recipes/{recipe.pk}/shopping_cart/'
+        self.assertEqual(self.client.post(path).status_code, 201)
+        self.check_totals_match_carts()
+        self.assertEqual(self.client.delete(path).status_code, 204)
+        self.check_totals_match_carts()
+
+    def test_cart_rows_changed_outside_views(self):
+        recipe = Recipe.objects.exclude(shoppings__user=self.reader).first()
+        cart = ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        self.check_totals_match_carts()
+        cart.delete()
+        self.check_totals_match_carts()
+
+    def test_recipe_edit_and_delete(self):
+        self.client.force_authenticate(self.author)
+        path = f'/api/recipes/{self.recipe.pk}/'
+        response = self.client.patch(path, {
+            'ingredients': [
+                {'id': self.ingredients[0].pk, 'amount': 100},
+                {'id': self.ingredients[1].pk, 'amount': 1},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.check_totals_match_carts()
+        self.assertEqual(self.client.delete(path).status_code, 204)
+        self.check_totals_match_carts()
+
+
+@override_settings(FEED_BACKFILL_SIZE=5)
+class SubscriptionRecipesTests(RecipeDataTestCase):
+    def setUp(self):
+        FeedEntry.objects.all().delete()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get_recipes(self, query=''):
+        response = self.client.get(f'/api/users/subscriptions/{query}')
+        self.assertEqual(response.status_code, 200)
+        subscription, = response.json()['results']
+        self.assertEqual(subscription['recipes_count'], RECIPES)
+        return [recipe['id'] for recipe in subscription['recipes']]
+
+    def test_recipes_beyond_backfill_are_listed(self):
+        FeedEntry.backfill_missing()
+        self.assertEqual(FeedEntry.objects.count(), 5)
+        latest = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        self.assertEqual(self.get_recipes(), latest)
+        self.assertEqual(self.get_recipes('?recipes_limit=3'), latest[:3])
+        self.assertEqual(self.get_recipes('?recipes_limit=8'), latest[:8])
+
+    def test_follow_without_feed_entries_lists_recipes(self):
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(len(self.get_recipes('?recipes_limit=3')), 3)
+
+    def test_user_without_subscriptions(self):
+        self.client.force_authenticate(self.author)
+        for query in ('', '?recipes_limit=3'):
+            with self.subTest(query=query), CaptureQueriesContext(
+                connection
+            ) as queries:
+                response = self.client.get(f'/api/users/subscriptions/{query}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'], [])
+            self.assertFalse(any(
+                'IN ()' in query['sql'] for query in queries.captured_queries
+            ))
+
+    def test_backfill_missing_skips_filled_feeds(self):
+        FeedEntry.backfill_missing()
+        FeedEntry.objects.filter(recipe=self.recipe).delete()
+        FeedEntry.backfill_missing()
+        self.assertEqual(FeedEntry.objects.count(), 4)
+
+
+class CounterTests(RecipeDataTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        return (
+            recipe.favorites_count,
+            recipe.shopping_count,
+            author.followers_count,
+            author.recipes_count,
+        )
+
+    def reset_counters(self):
+        Recipe.objects.update(favorites_count=0, shopping_count=0)
+        User.objects.update(followers_count=0, recipes_count=0)
+
+    def test_rows_created_outside_views_are_counted(self):
+        self.assertEqual(self.get_counters(), (1, 1, 1, RECIPES))
+        Favorite.objects.filter(recipe=self.recipe).delete()
+        Follow.objects.create(user=self.author, author=self.author)
+        self.assertEqual(self.get_counters(), (0, 1, 2, RECIPES))
+
+    def test_removing_rows_older_than_counters(self):
+        self.reset_counters()
+        for path in (
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            f'/api/users/{self.author.pk}/subscribe/',
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.delete(path).status_code, 204)
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).recipes_count, 0
+        )
+
+    def test_counters_are_filled_after_migrate(self):
+        self.reset_counters()
+        fill_counters(sender=None, using=DEFAULT_DB_ALIAS)
+        self.assertEqual(self.get_counters(), (1, 1, 1, RECIPES))
+
+
+class BatchActionTests(RecipeDataTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.recipes = list(Recipe.objects.order_by('pk'))
+        self.missing = self.recipes[-1].pk + 1000
+
+    def get_results(self, method, path, ids):
+        response = getattr(self.client, method)(
+            path, {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result['id'], result['status'])
+            for result in response.json()['results']
+        ]
+
+    def get_recipe(self, recipe):
+        return Recipe.objects.get(pk=recipe.pk)
+
+    def check_totals_match_carts(self):
+        self.assertEqual(
+            ShoppingTotal.compare([self.reader.pk]), ([], [], [])
+        )
+
+    def test_favorite_batch(self):
+        new, stored = self.recipes[0], self.recipes[1]
+        path = '/api/recipes/favorite/'
+        ids = [new.pk, stored.pk, self.missing, new.pk]
+        self.assertEqual(self.get_results('post', path, ids), [
+            (new.pk, 'created'),
+            (stored.pk, 'exists'),
+            (self.missing, 'not_found'),
+        ])
+        self.assertTrue(
+            Favorite.objects.filter(user=self.reader, recipe=new).exists()
+        )
+        self.assertEqual(self.get_recipe(new).favorites_count, 1)
+        self.assertEqual(self.get_recipe(stored).favorites_count, 1)
+        ids = [stored.pk, self.recipes[2].pk, stored.pk]
+        self.assertEqual(
+            self.get_results('delete', path, ids),
+            [(stored.pk, 'deleted'), (self.recipes[2].pk, 'not_found')],
+        )
+        self.assertFalse(
+            Favorite.objects.filter(user=self.reader, recipe=stored).exists()
+        )
+        self.assertEqual(self.get_recipe(stored).favorites_count, 0)
+
+    def test_shopping_cart_batch(self):
+        new, stored = self.recipes[0], self.recipes[1]
+        self.assertEqual(
+            self.get_results(
+                'post', '/api/recipes/shopping_cart/', [new.pk, stored.pk]
+            ),
+            [(new.pk, 'created'), (stored.pk, 'exists')],
+        )
+        self.assertEqual(self.get_recipe(new).shopping_count, 1)
+        self.check_totals_match_carts()
+        self.assertEqual(
+            self.get_results(
+                'delete', '/api/recipes/shopping_cart/', [new.pk, stored.pk]
+            ),
+            [(new.pk, 'deleted'), (stored.pk, 'deleted')],
+        )
+        self.assertEqual(self.get_recipe(new).shopping_count, 0)
+        self.assertEqual(self.get_recipe(stored).shopping_count, 0)
+        self.check_totals_match_carts()
+
+    def test_subscribe_batch(self):
+        author = User.objects.create_user(
+            email='second@example.com',
+            username='second',
+            first_name='Второй',
+            last_name='Автор',
+            password='password',
+        )
+        recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт второго автора',
+            text='Смешать и подать.',
+            cooking_time=1,
+        )
+        path = '/api/users/subscribe/'
+        ids = [author.pk, self.author.pk, self.reader.pk, author.pk]
+        self.assertEqual(self.get_results('post', path, ids), [
+            (author.pk, 'created'),
+            (self.author.pk, 'exists'),
+            (self.reader.pk, 'not_found'),
+        ])
+        self.assertEqual(User.objects.get(pk=author.pk).followers_count, 1)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, recipe=recipe).exists()
+        )
+        self.assertEqual(
+            self.get_results('delete', path, [author.pk]),
+            [(author.pk, 'deleted')],
+        )
+        self.assertEqual(User.objects.get(pk=author.pk).followers_count, 0)
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.reader, author=author).exists()
+        )
+
+    def test_batch_size_is_limited(self):
+        favorites = Favorite.objects.count()
+        for ids in ([], list(range(1, settings.BATCH_MAX_SIZE + 2))):
+            with self.subTest(size=len(ids)):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'ids': ids}, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Favorite.objects.count(), favorites)
+
+    def test_anonymous_batch_is_rejected(self):
+        response = APIClient().post(
+            '/api/recipes/favorite/', {'ids': [self.recipe.pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeUpdateTests(RecipeDataTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.path = f'/api/recipes/{self.recipe.pk}/'
+        Recipe.objects.filter(pk=self.recipe.pk).update(similar_stale=False)
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.path, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return queries.captured_queries
+
+    def get_writes(self, queries, model):
+        table = model._meta.db_table
+        return [
+            query['sql'].split()[0]
+            for query in queries
+            if table in query['sql']
+            and query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    def get_ingredients(self):
+        return {
+            row.ingredient_id: (row.pk, row.amount)
+            for row in IngredientRecipe.objects.filter(recipe=self.recipe)
+        }
+
+    def get_totals(self):
+        return dict(ShoppingTotal.objects.filter(
+            user=self.reader
+        ).values_list('ingredient_id', 'amount'))
+
+    def check_totals_match_carts(self):
+        self.assertEqual(
+            ShoppingTotal.compare([self.reader.pk]), ([], [], [])
+        )
+
+    def get_ingredients_data(self, amounts):
+        return [{'id': pk, 'amount': amount} for pk, amount in amounts.items()]
+
+    def test_patch_without_m2m_keys_does_not_write_m2m(self):
+        stored = self.get_ingredients()
+        queries = self.patch({'name': 'Новое название'})
+        self.assertEqual(self.get_writes(queries, IngredientRecipe), [])
+        self.assertEqual(self.get_writes(queries, TagRecipe), [])
+        self.assertEqual(self.get_ingredients(), stored)
+        self.assertFalse(Recipe.objects.get(pk=self.recipe.pk).similar_stale)
+
+    def test_amount_only_change(self):
+        stored = self.get_ingredients()
+        totals = self.get_totals()
+        changed = self.ingredients[0]
+        amounts = {pk: amount for pk, (_, amount) in stored.items()}
+        amounts[changed.pk] = 500
+        queries = self.patch({
+            'ingredients': self.get_ingredients_data(amounts),
+            'tags': [tag.pk for tag in self.tags],
+        })
+        self.assertEqual(
+            self.get_writes(queries, IngredientRecipe), ['UPDATE']
+        )
+        self.assertEqual(self.get_writes(queries, TagRecipe), [])
+        ingredients = self.get_ingredients()
+        self.assertEqual(ingredients[changed.pk], (stored[changed.pk][0], 500))
+        self.assertEqual(
+            {pk: row for pk, row in ingredients.items() if pk != changed.pk},
+            {pk: row for pk, row in stored.items() if pk != changed.pk},
+        )
+        self.assertEqual(
+            self.get_totals()[changed.pk],
+            totals[changed.pk] + 500 - stored[changed.pk][1],
+        )
+        self.check_totals_match_carts()
+        self.assertFalse(Recipe.objects.get(pk=self.recipe.pk).similar_stale)
+
+    def test_add_and_remove(self):
+        stored = self.get_ingredients()
+        totals = self.get_totals()
+        kept, removed = self.ingredients[0], self.ingredients[1]
+        ingredient = Ingredient.objects.create(
+            name='Новый ингредиент', measurement_unit='г'
+        )
+        tag = Tag.objects.create(name='Новый тег', color='#000010', slug='new')
+        self.patch({
+            'ingredients': self.get_ingredients_data({
+                kept.pk: stored[kept.pk][1],
+                ingredient.pk: 7,
+            }),
+            'tags': [self.tags[0].pk, tag.pk],
+        })
+        ingredients = self.get_ingredients()
+        self.assertEqual(set(ingredients), {kept.pk, ingredient.pk})
+        self.assertEqual(ingredients[kept.pk], stored[kept.pk])
+        self.assertEqual(ingredients[ingredient.pk][1], 7)
+        self.assertEqual(
+            set(TagRecipe.objects.filter(recipe=self.recipe).values_list(
+                'tag_id', flat=True
+            )),
+            {self.tags[0].pk, tag.pk},
+        )
+        new_totals = self.get_totals()
+        self.assertEqual(new_totals[ingredient.pk], 7)
+        self.assertEqual(
+            new_totals[removed.pk], totals[removed.pk] - stored[removed.pk][1]
+        )
+        self.assertEqual(new_totals[kept.pk], totals[kept.pk])
+        self.check_totals_match_carts()
+        self.assertTrue(Recipe.objects.get(pk=self.recipe.pk).similar_stale)
+
+
+@override_settings(CONCURRENT_FETCH_WORKERS=0)
+class RecipeCreateBudgetTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='password',
+        )
+        follower = User.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            first_name='Читатель',
+            last_name='Рецептов',
+            password='password',
+        )
+        Follow.objects.create(user=follower, author=author)
+        self.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        self.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def test_create_within_budget(self):
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+            'tags': [self.tag.pk],
+            'name': 'Новый рецепт',
+            'text': 'Смешать и подать.',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        assert_query_budget(response)
+
+
+class Base64ImageFieldTests(TestCase):
+    def test_whitespace_in_base64_is_ignored(self):
+        encoded = base64.encodebytes(GIF).decode()
+        self.assertIn('\n', encoded)
+        file = Base64ImageField().to_internal_value(
+            f'data:image/gif;base64, {encoded}'
+        )
+        self.assertEqual(file.read(), GIF)
+
+    def test_invalid_base64_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            Base64ImageField().to_internal_value('data:image/gif;base64,@@@@')
+
+
+@override_settings(AUTH_TOKEN_CACHE_TIMEOUT=30)
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            first_name='Читатель',
+            last_name='Рецептов',
+            password='password',
+        )
+        self.token = Token.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def logout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_token_is_rejected_after_logout(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/tags/')
+        self.logout()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_token_is_rejected_after_logout_on_another_worker(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        with mock.patch('api.authentication.token_cache', TokenCache()):
+            self.logout()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+class MetricsTests(TestCase):
+    def test_metrics_aggregate_worker_snapshots(self):
+        with TemporaryDirectory() as directory, override_settings(
+            METRICS_DIR=directory
+        ):
+            with open(os.path.join(directory, 'worker.json'), 'w') as file:
+                json.dump({'TagViewSet.list': {
+                    'requests': {'200': 5},
+                    'buckets': [5] * 11,
+                    'duration': 0.5,
+                    'db_duration': 0.1,
+                    'queries': 5,
+                }}, file)
+            self.client.get('/api/tags/')
+            local = registry.endpoints['TagViewSet.list'].requests[200]
+            content = self.client.get('/metrics/').content.decode()
+        self.assertIn(
+            'foodgram_requests_total{endpoint="TagViewSet.list",'
+            f'status="200"}} {local + 5}',
+            content,
+        )
+
+    def read_snapshot(self, directory):
+        with open(os.path.join(directory, registry.name)) as file:
+            return json.load(file)
+
+    @override_settings(METRICS_FLUSH_REQUESTS=1000, METRICS_FLUSH_SECONDS=3600)
+    def test_requests_do_not_rewrite_snapshot_below_threshold(self):
+        with TemporaryDirectory() as directory, override_settings(
+            METRICS_DIR=directory
+        ):
+            self.client.get('/api/tags/')
+            self.client.get('/metrics/')
+            snapshot = self.read_snapshot(directory)
+            for _ in range(3):
+                self.client.get('/api/tags/')
+            self.assertEqual(self.read_snapshot(directory), snapshot)
+            self.client.get('/metrics/')
+            requests = self.read_snapshot(directory)['TagViewSet.list'][
+                'requests'
+            ]
+        self.assertEqual(
+            requests['200'], snapshot['TagViewSet.list']['requests']['200'] + 3
+        )
+
+    @override_settings(METRICS_FLUSH_REQUESTS=1, METRICS_FLUSH_SECONDS=3600)
+    def test_snapshot_flushed_on_request_threshold(self):
+        with TemporaryDirectory() as directory, override_settings(
+            METRICS_DIR=directory
+        ):
+            self.client.get('/api/tags/')
+            snapshot = self.read_snapshot(directory)
+        self.assertEqual(
+            snapshot['TagViewSet.list']['requests']['200'],
+            registry.endpoints['TagViewSet.list'].requests[200],
+        )
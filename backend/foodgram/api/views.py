@@ -1,29 +1,48 @@
+from hashlib import sha256
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from foodgram.concurrency import fetch, gather
+from recipes.cache import get_reference, get_version, get_versions
+from recipes.memberships import get_memberships, memberships_changed
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import deferred_changes
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeAnonymousFilters, RecipeFilters
+from .exports import shopping_list_response
+from .fast_serializers import (IngredientFastSerializer, RecipeFastSerializer,
+                               SubscriptionFastSerializer, TagFastSerializer)
+from .filters import (ORDERINGS, IngredientFilter, RecipeAnonymousFilters,
+                      RecipeFilters)
+from .pagination import CustomPagination, LimitPagination
 from .permissions import AdminOrReadOnly, OwnerOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
+from .renderers import (CSVRenderer, FastJSONRenderer, PDFRenderer,
+                        PlainTextRenderer)
+from .serializers import (BatchSerializer, FavoriteSerializer,
+                          IngredientSerializer, RecipeNestedSerializer,
                           RecipeSerializer, RecipeViewSerializer,
                           ShoppingCartSerializer, SubscribeSerializer,
-                          TagSerializer)
+                          TagSerializer, get_recipes_limit)
 
 User = get_user_model()
 
+RECIPE_VERSIONS = ('tags', 'ingredients')
+
 
-class CustomPagination(PageNumberPagination):
-    page_size_query_param = 'limit'
-    page_size = 6
+def split_fields(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
 
 
 class CreateDeleteMixin:
@@ -32,17 +51,195 @@ class CreateDeleteMixin:
         if request.method == 'POST':
             serializer = serializer(data=data, context={'request': request})
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                memberships_changed(request)
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED,
             )
-        obj_exists.delete()
+        with transaction.atomic(), deferred_changes():
+            list(obj_exists.select_for_update())
+            obj_exists.delete()
+            memberships_changed(request)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def batch_obj_action(self, request, model, field, targets):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        attname = f'{field}_id'
+        with transaction.atomic():
+            stored = {
+                getattr(obj, attname): obj
+                for obj in model.objects.select_for_update().filter(
+                    user=request.user, **{f'{attname}__in': ids}
+                )
+            }
+            if request.method == 'POST':
+                results = self.batch_create(
+                    request, model, attname, ids, stored, targets
+                )
+            else:
+                results = self.batch_delete(request, model, attname, stored)
+        return Response({
+            'results': [
+                {'id': pk, 'status': results.get(pk, 'not_found')}
+                for pk in ids
+            ]
+        })
+
+    def batch_create(self, request, model, attname, ids, stored, targets):
+        found = targets.filter(pk__in=ids).values_list('pk', flat=True)
+        objs = [
+            model(user=request.user, **{attname: pk})
+            for pk in found if pk not in stored
+        ]
+        if objs:
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+            model.changed(objs, 1)
+            memberships_changed(request)
+        results = dict.fromkeys(stored, 'exists')
+        results.update(
+            (getattr(obj, attname), 'created') for obj in objs
+        )
+        return results
+
+    def batch_delete(self, request, model, attname, stored):
+        if stored:
+            with deferred_changes():
+                model.objects.filter(
+                    user=request.user, **{f'{attname}__in': list(stored)}
+                ).delete()
+            memberships_changed(request)
+        return dict.fromkeys(stored, 'deleted')
+
+
+class SparseFieldsMixin:
+    sparse_actions = ('list', 'retrieve')
+    field_views = {}
+    selected_fields = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.sparse_actions:
+            self.selected_fields = self.get_selected_fields(request)
+
+    def get_sparse_serializer_class(self):
+        return self.get_serializer_class()
+
+    def get_selected_fields(self, request):
+        params = request.query_params
+        if not any(name in params for name in ('fields', 'omit', 'view')):
+            return None
+        available = [
+            name for name, field
+            in self.get_sparse_serializer_class()().fields.items()
+            if not field.write_only
+        ]
+        selected = available
+        if 'view' in params:
+            selected = self.field_views.get(params['view'])
+            if selected is None:
+                raise ValidationError({
+                    'view': [f"Неизвестное представление: {params['view']}."]
+                })
+        if 'fields' in params:
+            selected = split_fields(params['fields'])
+        omitted = split_fields(params.get('omit', ''))
+        errors = {}
+        for param, names in (('fields', selected), ('omit', omitted)):
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                errors[param] = [f"Неизвестные поля: {', '.join(unknown)}."]
+        if errors:
+            raise ValidationError(errors)
+        return frozenset(selected) - frozenset(omitted)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.selected_fields
+        return context
+
 
-class CustomUserViewSet(UserViewSet, CreateDeleteMixin):
+class FastSerializerMixin:
+    fast_serializer_classes = {}
+
+    def get_fast_serializer_class(self):
+        if not settings.FAST_SERIALIZERS:
+            return None
+        return self.fast_serializer_classes.get(self.action)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_fast_serializer_class()
+        if serializer_class is None or not kwargs.get('many'):
+            return super().get_serializer(*args, **kwargs)
+        return serializer_class(
+            *args, many=True, context=self.get_serializer_context()
+        )
+
+
+class ConditionalGetMixin:
+    def conditional_response(
+        self, etag_func, handler, request, *args, **kwargs
+    ):
+        etag = etag_func()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class ReferenceDataMixin(FastSerializerMixin, ConditionalGetMixin):
+    reference = None
+
+    def get_etag(self):
+        return quote_etag(f'{self.reference}-{get_version(self.reference)}')
+
+    def get_object(self):
+        try:
+            pk = int(self.kwargs['pk'])
+            obj = get_reference(self.reference, [pk])[pk]
+        except (KeyError, ValueError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_etag, self.list_reference, request, *args, **kwargs
+        )
+
+    def list_reference(self, request, *args, **kwargs):
+        filterset = getattr(self, 'filterset_class', None)
+        filters = filterset.base_filters if filterset else {}
+        if any(name in request.query_params for name in filters):
+            return super().list(request, *args, **kwargs)
+        objects = list(get_reference(self.reference).values())
+        page = self.paginate_queryset(objects)
+        if page is not None:
+            return self.get_paginated_response(
+                self.get_serializer(page, many=True).data
+            )
+        return Response(self.get_serializer(objects, many=True).data)
+
+
+class CustomUserViewSet(
+    SparseFieldsMixin,
+    FastSerializerMixin,
+    UserViewSet,
+    CreateDeleteMixin,
+):
     pagination_class = CustomPagination
+    sparse_actions = ('list', 'retrieve', 'get_self_page', 'subscriptions')
+    fast_serializer_classes = {'subscriptions': SubscriptionFastSerializer}
+
+    def get_sparse_serializer_class(self):
+        if self.action == 'subscriptions':
+            return SubscribeSerializer
+        return super().get_sparse_serializer_class()
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -67,6 +264,21 @@ class CustomUserViewSet(UserViewSet, CreateDeleteMixin):
             data,
         )
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='subscribe',
+        url_name='subscribe-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def subscribe_batch(self, request):
+        return self.batch_obj_action(
+            request,
+            Follow,
+            'author',
+            User.objects.exclude(pk=request.user.pk),
+        )
+
     @action(
         methods=('get',),
         url_path='me',
@@ -83,36 +295,142 @@ class CustomUserViewSet(UserViewSet, CreateDeleteMixin):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
-        followers = self.paginate_queryset(request.user.followers.all())
-        serializer = SubscribeSerializer(
+        followers = self.paginate_queryset(
+            request.user.followers.select_related('author').order_by('id')
+        )
+        recipes = None
+        if self.selected_fields is None or 'recipes' in self.selected_fields:
+            recipes = FeedEntry.latest_by_author(
+                request.user,
+                [follow.author for follow in followers],
+                get_recipes_limit(request),
+            )
+        serializer_class = (
+            self.get_fast_serializer_class() or SubscribeSerializer
+        )
+        serializer = serializer_class(
             followers,
             many=True,
-            context={'request': request},
+            context={
+                'request': request,
+                'recipes': recipes,
+                'fields': self.selected_fields,
+            },
         )
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
+    reference = 'ingredients'
+    fast_serializer_classes = {'list': IngredientFastSerializer}
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (AdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
-    pagination_class = None
+    pagination_class = LimitPagination
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
+    reference = 'tags'
+    fast_serializer_classes = {'list': TagFastSerializer}
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     permission_classes = (AdminOrReadOnly,)
 
 
-class RecipeViewSet(viewsets.ModelViewSet, CreateDeleteMixin):
+class RecipeViewSet(
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    FastSerializerMixin,
+    viewsets.ModelViewSet,
+    CreateDeleteMixin,
+):
     queryset = Recipe.objects.all()
     permission_classes = (OwnerOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
-    filterset_class = RecipeFilters
     pagination_class = CustomPagination
+    sparse_actions = ('list', 'retrieve', 'feed')
+    fast_serializer_classes = {
+        'list': RecipeFastSerializer,
+        'feed': RecipeFastSerializer,
+    }
+    field_views = {
+        'card': (
+            'id', 'name', 'image', 'image_thumb', 'cooking_time', 'author',
+        ),
+    }
+
+    @property
+    def filterset_class(self):
+        if self.request.user.is_anonymous:
+            return RecipeAnonymousFilters
+        return RecipeFilters
+
+    def get_state(self):
+        if self.action == 'retrieve':
+            return Recipe.objects.filter(pk=self.get_pk()).values_list(
+                'updated_at', 'author__updated_at'
+            ).first()
+        aggregates = {
+            'count': Count('pk'),
+            'updated': Max('updated_at'),
+            'last': Max('pk'),
+            'authors': Max('author__updated_at'),
+        }
+        ordering = self.request.query_params.get('ordering')
+        if ordering in ORDERINGS:
+            aggregates['scores'] = Sum(ORDERINGS[ordering].lstrip('-'))
+        return self.filter_queryset(
+            Recipe.objects.all()
+        ).order_by().aggregate(**aggregates)
+
+    def get_user_state(self):
+        return get_memberships(self.request).state
+
+    def get_etag(self):
+        state, user_state, versions = gather(
+            self.get_state,
+            self.get_user_state,
+            lambda: get_versions(RECIPE_VERSIONS),
+        )
+        if self.action == 'list':
+            self.object_count = state['count']
+        parts = [
+            self.request.get_full_path(),
+            self.request.user.pk,
+            state,
+            user_state,
+            *versions,
+        ]
+        return quote_etag(sha256(repr(parts).encode()).hexdigest())
+
+    def get_pk(self):
+        try:
+            return int(self.kwargs['pk'])
+        except ValueError:
+            raise Http404
+
+    def get_object(self):
+        if self.action != 'retrieve':
+            return super().get_object()
+        objs = fetch(
+            self.filter_queryset(self.get_queryset()).filter(pk=self.get_pk())
+        )
+        if not objs:
+            raise Http404
+        self.check_object_permissions(self.request, objs[0])
+        return objs[0]
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_etag, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_etag, super().retrieve, request, *args, **kwargs
+        )
 
     def get_serializer_class(self):
         if self.action == "create" or (self.action == "update"):
@@ -138,40 +456,79 @@ class RecipeViewSet(viewsets.ModelViewSet, CreateDeleteMixin):
             data,
         )
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_obj_action(
+            request,
+            ShoppingCart,
+            'recipe',
+            Recipe.objects.all(),
+        )
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            FeedEntry.fan_out(serializer.save(author=self.request.user))
 
     def get_queryset(self):
-        if self.request.user.is_anonymous:
-            self.filterset_class = RecipeAnonymousFilters
-        return super().get_queryset()
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'feed'):
+            queryset = queryset.with_related(self.selected_fields)
+            if self.get_fast_serializer_class():
+                return queryset.prefetch_related(None)
+            return queryset
+        return queryset
 
     @action(
         methods=['get'],
         detail=False,
         permission_classes=(IsAuthenticated,),
-
+        renderer_classes=(
+            PlainTextRenderer,
+            CSVRenderer,
+            PDFRenderer,
+            FastJSONRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        text = 'Cписок покупок: \n'
-
-        shopping_cart = IngredientRecipe.objects.filter(
-            recipe_id__in=user.shoppings.values_list('recipe_id', flat=True)
-        ).values_list(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(Sum('amount'))
-
-        for index, ingredient in enumerate(sorted(shopping_cart), start=1):
-            text += f'{index}. {ingredient[0].capitalize()} '
-            text += f'({ingredient[1]}) - {ingredient[2]};\n'
+        return shopping_list_response(
+            request,
+            request.accepted_renderer.format,
+        )
 
-        response = HttpResponse(text, content_type='text/plain')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping-list.txt"'
+    @action(methods=['get'], detail=True)
+    def similar(self, request, pk):
+        recipes = list(
+            Recipe.objects.filter(similar_to__recipe=self.get_pk()).order_by(
+                '-similar_to__score', 'pk'
+            )
+        )
+        if not recipes:
+            self.get_object()
+        serializer = RecipeNestedSerializer(
+            recipes,
+            many=True,
+            context={'request': request},
         )
+        return Response(serializer.data)
 
-        return response
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            feed_entries__user=request.user
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         methods=['post', 'delete'],
@@ -189,3 +546,18 @@ class RecipeViewSet(viewsets.ModelViewSet, CreateDeleteMixin):
             FavoriteSerializer,
             data,
         )
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def favorite_batch(self, request):
+        return self.batch_obj_action(
+            request,
+            Favorite,
+            'recipe',
+            Recipe.objects.all(),
+        )
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import copy_context
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import QuerySet, prefetch_related_objects
+
+from .instrumentation import current_recorder
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.CONCURRENT_FETCH_WORKERS,
+        thread_name_prefix='fetch',
+    )
+
+
+def run(call):
+    recorder = current_recorder.get()
+    try:
+        with recorder.recording() if recorder else nullcontext():
+            return call()
+    finally:
+        close_old_connections()
+
+
+def gather(*calls):
+    if len(calls) < 2 or not settings.CONCURRENT_FETCH_WORKERS:
+        return [call() for call in calls]
+    futures = [
+        get_executor().submit(copy_context().run, run, call)
+        for call in calls[1:]
+    ]
+    try:
+        first = calls[0]()
+    finally:
+        results = [future.result() for future in futures]
+    return [first, *results]
+
+
+def prefetch(objs, *lookups):
+    for obj in objs:
+        if not hasattr(obj, '_prefetched_objects_cache'):
+            obj._prefetched_objects_cache = {}
+    gather(*(
+        partial(prefetch_related_objects, objs, lookup)
+        for lookup in lookups
+    ))
+    return objs
+
+
+def fetch(queryset):
+    if not isinstance(queryset, QuerySet):
+        return list(queryset)
+    lookups = queryset._prefetch_related_lookups
+    if not lookups:
+        return list(queryset)
+    return prefetch(list(queryset.prefetch_related(None)), *lookups)
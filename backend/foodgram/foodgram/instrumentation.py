@@ -0,0 +1,301 @@
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from glob import glob
+from time import monotonic, perf_counter
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UNRESOLVED = 'unresolved'
+
+logger = logging.getLogger(__name__)
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.duration = 0
+
+    @contextmanager
+    def recording(self):
+        token = current_recorder.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+                yield
+        finally:
+            current_recorder.reset(token)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.count += 1
+                self.duration += perf_counter() - started
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0
+        self.db_duration = 0
+        self.queries = 0
+
+    def as_dict(self):
+        return {
+            'requests': dict(self.requests),
+            'buckets': list(self.buckets),
+            'duration': self.duration,
+            'db_duration': self.db_duration,
+            'queries': self.queries,
+        }
+
+    def merge(self, values):
+        for status, count in values['requests'].items():
+            self.requests[int(status)] += count
+        self.buckets = [
+            count + other
+            for count, other in zip(self.buckets, values['buckets'])
+        ]
+        self.duration += values['duration']
+        self.db_duration += values['db_duration']
+        self.queries += values['queries']
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dump_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.name = f'{self.pid}-{uuid4().hex}.json'
+        self.endpoints = defaultdict(EndpointStats)
+        self.pending = 0
+        self.flushed = monotonic()
+
+    def snapshot(self):
+        return {
+            endpoint: stats.as_dict()
+            for endpoint, stats in self.endpoints.items()
+        }
+
+    def dump(self, name, snapshot):
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, name)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(f'{path}.tmp', path)
+
+    def flush(self, blocking=True):
+        if not settings.METRICS_DIR:
+            return
+        if not self.dump_lock.acquire(blocking=blocking):
+            return
+        try:
+            with self.lock:
+                if not self.pending:
+                    return
+                name, snapshot = self.name, self.snapshot()
+                self.pending = 0
+                self.flushed = monotonic()
+            self.dump(name, snapshot)
+        finally:
+            self.dump_lock.release()
+
+    def flush_due(self):
+        return settings.METRICS_DIR and (
+            self.pending >= settings.METRICS_FLUSH_REQUESTS
+            or monotonic() - self.flushed >= settings.METRICS_FLUSH_SECONDS
+        )
+
+    def load(self):
+        snapshots = []
+        for path in glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def collect(self):
+        if settings.METRICS_DIR:
+            self.flush()
+            snapshots = self.load()
+        else:
+            with self.lock:
+                snapshots = [self.snapshot()]
+        endpoints = defaultdict(EndpointStats)
+        for snapshot in snapshots:
+            for endpoint, values in snapshot.items():
+                endpoints[endpoint].merge(values)
+        return sorted(endpoints.items())
+
+    def observe(self, endpoint, status, duration, recorder):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            stats = self.endpoints[endpoint]
+            stats.requests[status] += 1
+            stats.duration += duration
+            stats.db_duration += recorder.duration
+            stats.queries += recorder.count
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[index] += 1
+            self.pending += 1
+            due = self.flush_due()
+        if due:
+            self.flush(blocking=False)
+
+    def render(self):
+        endpoints = self.collect()
+        lines = [
+            '# HELP foodgram_requests_total Обработанные запросы.',
+            '# TYPE foodgram_requests_total counter',
+        ]
+        for endpoint, stats in endpoints:
+            for status, count in sorted(stats.requests.items()):
+                lines.append(
+                    f'foodgram_requests_total{{endpoint="{endpoint}",'
+                    f'status="{status}"}} {count}'
+                )
+        lines += [
+            '# HELP foodgram_request_duration_seconds Время ответа.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        for endpoint, stats in endpoints:
+            label = f'endpoint="{endpoint}"'
+            for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                lines.append(
+                    f'foodgram_request_duration_seconds_bucket'
+                    f'{{{label},le="{bound}"}} {count}'
+                )
+            total = sum(stats.requests.values())
+            lines += [
+                f'foodgram_request_duration_seconds_bucket'
+                f'{{{label},le="+Inf"}} {total}',
+                f'foodgram_request_duration_seconds_sum{{{label}}} '
+                f'{stats.duration:.6f}',
+                f'foodgram_request_duration_seconds_count{{{label}}} '
+                f'{total}',
+            ]
+        lines += [
+            '# HELP foodgram_db_queries_total Запросы к базе данных.',
+            '# TYPE foodgram_db_queries_total counter',
+        ]
+        lines += [
+            f'foodgram_db_queries_total{{endpoint="{endpoint}"}} '
+            f'{stats.queries}'
+            for endpoint, stats in endpoints
+        ]
+        lines += [
+            '# HELP foodgram_db_duration_seconds_total Время в базе.',
+            '# TYPE foodgram_db_duration_seconds_total counter',
+        ]
+        lines += [
+            f'foodgram_db_duration_seconds_total{{endpoint="{endpoint}"}} '
+            f'{stats.db_duration:.6f}'
+            for endpoint, stats in endpoints
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def get_endpoint_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', UNRESOLVED)
+    actions = getattr(view_func, 'actions', None) or {}
+    handler = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{handler}'
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.endpoint_name = UNRESOLVED
+        recorder = QueryRecorder()
+        started = perf_counter()
+        with recorder.recording():
+            response = self.get_response(request)
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries", '
+            f'total;dur={(perf_counter() - started) * 1000:.1f}'
+        )
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content,
+                request,
+                response,
+                recorder,
+                started,
+            )
+        else:
+            self.finish(request, response, recorder, started)
+        return response
+
+    def stream(self, content, request, response, recorder, started):
+        with recorder.recording():
+            yield from content
+        self.finish(request, response, recorder, started)
+
+    def finish(self, request, response, recorder, started):
+        duration = perf_counter() - started
+        endpoint = request.endpoint_name
+        registry.observe(endpoint, response.status_code, duration, recorder)
+        response.instrumentation = {
+            'endpoint': endpoint,
+            'queries': recorder.count,
+            'db_duration': recorder.duration,
+            'duration': duration,
+        }
+        budget = settings.QUERY_BUDGETS.get(endpoint)
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                '%s: %s запросов к БД при бюджете %s',
+                endpoint, recorder.count, budget,
+            )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.endpoint_name = get_endpoint_name(request, view_func)
+
+
+def metrics(request):
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def assert_query_budget(response, budget=None):
+    endpoint = response.instrumentation['endpoint']
+    queries = response.instrumentation['queries']
+    if budget is None:
+        budget = settings.QUERY_BUDGETS.get(endpoint)
+    if budget is not None and queries > budget:
+        raise AssertionError(
+            f'{endpoint}: {queries} запросов к БД при бюджете {budget}'
+        )
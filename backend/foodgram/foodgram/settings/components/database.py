@@ -9,9 +9,38 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
         'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
 
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(',')),
+    start=1,
+):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['foodgram.replicas.PrimaryReplicaRouter']
+DATABASE_STICKY_SECONDS = int(os.getenv('DB_STICKY_SECONDS', default=10))
+DATABASE_REPLICA_ENDPOINTS = {
+    'RecipeViewSet.list',
+    'RecipeViewSet.retrieve',
+    'RecipeViewSet.feed',
+    'RecipeViewSet.similar',
+    'TagViewSet.list',
+    'TagViewSet.retrieve',
+    'IngredientViewSet.list',
+    'IngredientViewSet.retrieve',
+    'CustomUserViewSet.subscriptions',
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
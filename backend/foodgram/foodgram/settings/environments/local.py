@@ -5,10 +5,20 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
+FAST_SERIALIZERS = os.getenv('FAST_SERIALIZERS', default='1') == '1'
+JSON_ENCODER = os.getenv(
+    'JSON_ENCODER', default='api.encoders.encode_orjson'
+)
+
 
 DJOSER = {
     'SERIALIZERS': {
@@ -25,6 +35,25 @@ DJOSER = {
 }
 
 
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', 300))
+REFERENCE_VERSION_TIMEOUT = int(os.getenv('REFERENCE_VERSION_TIMEOUT', 60))
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 600))
+
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -40,4 +69,63 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+RECIPE_IMAGE_SIZE = (1280, 1280)
+RECIPE_THUMB_SIZE = (400, 400)
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+CONCURRENT_FETCH_WORKERS = int(os.getenv('CONCURRENT_FETCH_WORKERS', 4))
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv(
+    'AUTH_TOKEN_CACHE_TIMEOUT',
+    0 if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES else 30,
+))
+AUTH_TOKEN_SHARED_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_SHARED_CACHE_TIMEOUT', 0)
+)
+
+BATCH_MAX_SIZE = 100
+
+QUERY_BUDGETS = {
+    'RecipeViewSet.list': 9,
+    'RecipeViewSet.retrieve': 9,
+    'RecipeViewSet.create': 10,
+    'RecipeViewSet.feed': 9,
+    'RecipeViewSet.download_shopping_cart': 2,
+    'CustomUserViewSet.subscriptions': 4,
+    'TagViewSet.list': 2,
+    'IngredientViewSet.list': 3,
+}
+METRICS_DIR = os.getenv('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+METRICS_FLUSH_REQUESTS = int(os.getenv('METRICS_FLUSH_REQUESTS', 100))
+
+FEED_BACKFILL_SIZE = 50
+FEED_BATCH_SIZE = 1000
+
+SHOPPING_TOTAL_BATCH_SIZE = 1000
+
+RECIPE_INDEX_REBUILD_SECONDS = int(
+    os.getenv('RECIPE_INDEX_REBUILD_SECONDS', 600)
+)
+RECIPE_INDEX_SYNC_SECONDS = float(os.getenv('RECIPE_INDEX_SYNC_SECONDS', 1))
+RECIPE_INDEX_BACKGROUND_BUILD = (
+    os.getenv('RECIPE_INDEX_BACKGROUND_BUILD', default='1') == '1'
+)
+RECIPE_INDEX_MAX_RESULTS = 1000
+
+SIMILAR_RECIPES_TOP_K = 10
+SIMILAR_RECIPES_MAX_SHARE = 0.2
+
+RECIPE_SCORE_WINDOW_DAYS = 365
+POPULARITY_HALF_LIFE_DAYS = 30
+TRENDING_HALF_LIFE_DAYS = 3
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
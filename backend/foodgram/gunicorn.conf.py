@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+SERVER_MODES = {
+    'wsgi': ('foodgram.wsgi:application', 'sync'),
+    'asgi': ('foodgram.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+
+server_mode = os.getenv('SERVER_MODE', default='wsgi')
+wsgi_app, worker_class = SERVER_MODES[server_mode]
+bind = os.getenv('GUNICORN_BIND', default='0:8000')
+workers = int(
+    os.getenv('GUNICORN_WORKERS', default=multiprocessing.cpu_count() + 1)
+)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+metrics_dir = os.getenv('METRICS_DIR') or os.path.join(
+    tempfile.gettempdir(), 'foodgram-metrics'
+)
+raw_env = [f'METRICS_DIR={metrics_dir}']
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def worker_exit(server, worker):
+    from foodgram.instrumentation import registry
+
+    registry.flush()
@@ -9,13 +9,10 @@ class TagAdmin(admin.ModelAdmin):
 
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'id', 'author')
-    readonly_fields = ('favorites',)
-    fields = ('name', 'author', 'favorites',)
+    readonly_fields = ('favorites_count',)
+    fields = ('name', 'author', 'favorites_count',)
     list_filter = ('name', 'author', 'tag')
 
-    def favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj.id).count()
-
 
 class IngredientAdmin(admin.ModelAdmin):
     fields = ('name', 'measurement_unit',)
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from .search import create_search_indexes
+        from .signals import (backfill_feeds, fill_counters,
+                              rebuild_shopping_totals)
+
+        post_migrate.connect(create_search_indexes, sender=self)
+        post_migrate.connect(fill_counters, sender=self)
+        post_migrate.connect(rebuild_shopping_totals, sender=self)
+        post_migrate.connect(backfill_feeds, sender=self)
@@ -0,0 +1,76 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Ingredient, Tag
+
+VERSION_KEY = 'reference:{}:version'
+DATA_KEY = 'reference:{}:{}'
+REFERENCE_MODELS = {
+    'tags': Tag,
+    'ingredients': Ingredient,
+}
+
+_local = {}
+
+
+def load_reference(name):
+    objects = REFERENCE_MODELS[name].objects.using(
+        DEFAULT_DB_ALIAS
+    ).order_by('pk').in_bulk()
+    version = sha256(repr([
+        [getattr(obj, field.attname) for field in obj._meta.concrete_fields]
+        for obj in objects.values()
+    ]).encode()).hexdigest()
+    cache.set(
+        DATA_KEY.format(name, version),
+        objects,
+        settings.REFERENCE_CACHE_TIMEOUT,
+    )
+    cache.set(
+        VERSION_KEY.format(name), version, settings.REFERENCE_VERSION_TIMEOUT
+    )
+    return version, objects
+
+
+def get_version(name):
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    return load_reference(name)[0]
+
+
+def get_versions(names):
+    keys = {VERSION_KEY.format(name): name for name in names}
+    versions = cache.get_many(keys)
+    return [
+        versions[key] if key in versions else get_version(name)
+        for key, name in keys.items()
+    ]
+
+
+def bump_version(name):
+    cache.delete(VERSION_KEY.format(name))
+    _local.pop(name, None)
+
+
+def get_reference(name, pks=()):
+    version = get_version(name)
+    entry = _local.get(name)
+    if entry and entry[0] == version:
+        objects = entry[1]
+    else:
+        objects = cache.get(DATA_KEY.format(name, version))
+        if objects is None:
+            version, objects = load_reference(name)
+        _local[name] = (version, objects)
+    missing = [pk for pk in pks if pk not in objects]
+    if missing and REFERENCE_MODELS[name].objects.using(
+        DEFAULT_DB_ALIAS
+    ).filter(pk__in=missing).exists():
+        version, objects = load_reference(name)
+        _local[name] = (version, objects)
+    return objects
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Follow, Recipe, ShoppingCart
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def repair_counters(dry_run=False, batch_size=1000):
+    drift = []
+    for model, field, source, lookup in COUNTERS:
+        actual = Subquery(
+            source.objects.filter(
+                **{lookup: OuterRef('pk')}
+            ).order_by().values(lookup).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        )
+        drifted = model.objects.annotate(
+            actual=Coalesce(actual, 0)
+        ).exclude(
+            **{field: F('actual')}
+        ).order_by().values_list('pk', 'actual')
+        objs = [model(pk=pk, **{field: value}) for pk, value in drifted]
+        if objs and not dry_run:
+            model.objects.bulk_update(objs, [field], batch_size=batch_size)
+        drift.append((f'{model._meta.label}.{field}', len(objs)))
+    return drift
@@ -0,0 +1,96 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import sha256
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+IMAGE_DIR = 'recipes/images/'
+THUMB_DIR = 'recipes/thumbs/'
+
+logger = logging.getLogger(__name__)
+
+
+class ImmediateExecutor:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+class WorkerPoolExecutor(ThreadPoolExecutor):
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(self.run, fn, *args, **kwargs)
+
+    @staticmethod
+    def run(fn, *args, **kwargs):
+        close_old_connections()
+        try:
+            fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    if settings.IMAGE_PIPELINE_WORKERS:
+        return WorkerPoolExecutor(
+            max_workers=settings.IMAGE_PIPELINE_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return ImmediateExecutor()
+
+
+def schedule_image_processing(recipe):
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: get_executor().submit(run_job, recipe_id, name)
+    )
+
+
+def run_job(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def encode(image, directory, image_format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **params)
+    content = buffer.getvalue()
+    name = f'{directory}{sha256(content).hexdigest()}.{image_format.lower()}'
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+    return name
+
+
+def process_recipe_image(recipe_id, name):
+    with default_storage.open(name, 'rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    thumb = image.copy()
+    image.thumbnail(settings.RECIPE_IMAGE_SIZE)
+    thumb.thumbnail(settings.RECIPE_THUMB_SIZE)
+    if image.mode == 'RGBA':
+        image_name = encode(image, IMAGE_DIR, 'PNG', optimize=True)
+    else:
+        image_name = encode(
+            image, IMAGE_DIR, 'JPEG', quality=85, optimize=True
+        )
+    thumb_name = encode(thumb, THUMB_DIR, 'WEBP', quality=80)
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image=image_name,
+        image_thumb=thumb_name,
+        updated_at=timezone.now(),
+    )
+    if updated and name != image_name:
+        default_storage.delete(name)
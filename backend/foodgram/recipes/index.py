@@ -0,0 +1,186 @@
+import logging
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from time import monotonic
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Max
+
+from .models import IngredientRecipe, Recipe
+
+MAX_PATCH_SIZE = 1000
+EMPTY = array('q')
+
+logger = logging.getLogger(__name__)
+
+
+class RecipeIngredientIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.built = None
+        self.checked = None
+        self.building = False
+        self.postings = {}
+        self.recipes = {}
+
+    def match(self, ingredient_ids, minimum):
+        ingredient_ids = set(ingredient_ids)
+        if minimum > len(ingredient_ids):
+            return {}
+        with self.lock:
+            if not self.sync():
+                return None
+            postings = sorted(
+                (self.postings.get(pk, EMPTY) for pk in ingredient_ids),
+                key=len,
+            )
+            if minimum == len(postings):
+                return self.intersect(postings)
+            counts = Counter()
+            for posting in postings:
+                counts.update(posting)
+        return {pk: count for pk, count in counts.items() if count >= minimum}
+
+    @staticmethod
+    def intersect(postings):
+        if not postings:
+            return {}
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return dict.fromkeys(result, len(postings))
+
+    def sync(self):
+        now = monotonic()
+        if self.state is not None and (
+            self.checked is None
+            or now - self.checked >= settings.RECIPE_INDEX_SYNC_SECONDS
+        ):
+            state = get_state()
+            self.checked = now
+            if state != self.state and not self.patch(state):
+                self.state = None
+        if (
+            self.state is None
+            or now - self.built > settings.RECIPE_INDEX_REBUILD_SECONDS
+        ):
+            self.schedule_build()
+        return self.state is not None
+
+    def schedule_build(self):
+        if self.building:
+            return
+        if not settings.RECIPE_INDEX_BACKGROUND_BUILD:
+            self.install(*load_index())
+            self.checked = monotonic()
+            return
+        self.building = True
+        threading.Thread(
+            target=self.build_in_background,
+            name='recipe-index',
+            daemon=True,
+        ).start()
+
+    def build_in_background(self):
+        try:
+            loaded = load_index()
+        except Exception:
+            logger.exception('Не удалось построить индекс ингредиентов')
+            loaded = None
+        finally:
+            connections.close_all()
+        with self.lock:
+            if loaded is not None:
+                self.install(*loaded)
+            self.building = False
+
+    def mark_stale(self):
+        with self.lock:
+            self.checked = None
+
+    def install(self, state, postings, recipes):
+        self.postings = postings
+        self.recipes = recipes
+        self.state = state
+        self.built = monotonic()
+        self.checked = None
+
+    def patch(self, state):
+        count, updated, last = self.state
+        changed = Recipe.objects.using(DEFAULT_DB_ALIAS)
+        if updated is not None:
+            changed = changed.filter(updated_at__gte=updated)
+        recipe_ids = list(
+            changed.values_list('pk', flat=True)[:MAX_PATCH_SIZE + 1]
+        )
+        created = sum(pk > (last or 0) for pk in recipe_ids)
+        if len(recipe_ids) > MAX_PATCH_SIZE or count + created != state[0]:
+            return False
+        current = defaultdict(set)
+        rows = IngredientRecipe.objects.using(DEFAULT_DB_ALIAS).filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows:
+            current[recipe_id].add(ingredient_id)
+        for recipe_id in recipe_ids:
+            self.replace(recipe_id, frozenset(current[recipe_id]))
+        self.state = state
+        return True
+
+    def replace(self, recipe_id, ingredient_ids):
+        stored = self.recipes.pop(recipe_id, frozenset())
+        for ingredient_id in stored - ingredient_ids:
+            posting = self.postings[ingredient_id]
+            position = bisect_left(posting, recipe_id)
+            if position < len(posting) and posting[position] == recipe_id:
+                del posting[position]
+        for ingredient_id in ingredient_ids - stored:
+            insort(
+                self.postings.setdefault(ingredient_id, array('q')),
+                recipe_id,
+            )
+        if ingredient_ids:
+            self.recipes[recipe_id] = ingredient_ids
+
+
+index = RecipeIngredientIndex()
+
+
+def load_index():
+    state = get_state()
+    postings = defaultdict(list)
+    recipes = defaultdict(list)
+    rows = IngredientRecipe.objects.using(DEFAULT_DB_ALIAS).order_by(
+        'ingredient_id', 'recipe_id'
+    ).values_list('ingredient_id', 'recipe_id')
+    for ingredient_id, recipe_id in rows.iterator():
+        postings[ingredient_id].append(recipe_id)
+        recipes[recipe_id].append(ingredient_id)
+    return (
+        state,
+        {
+            ingredient_id: array('q', recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        },
+        {
+            recipe_id: frozenset(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        },
+    )
+
+
+def get_state():
+    state = Recipe.objects.using(DEFAULT_DB_ALIAS).aggregate(
+        count=Count('pk'), updated=Max('updated_at'), last=Max('pk')
+    )
+    return state['count'], state['updated'], state['last']
+
+
+def match_recipes(ingredient_ids, minimum):
+    return index.match(ingredient_ids, minimum)
@@ -0,0 +1,281 @@
+import json
+import platform
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection, HTTPException
+from time import monotonic
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db.models import Count
+from foodgram.instrumentation import registry
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+
+from .benchmark_serving import percentile
+
+User = get_user_model()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Scenario:
+    def __init__(self, name, endpoint, path, method='GET', auth=False):
+        self.name = name
+        self.endpoint = endpoint
+        self.path = path
+        self.method = method
+        self.auth = auth
+
+    def request(self, data, rng):
+        path = self.path(data, rng) if callable(self.path) else self.path
+        if self.method == 'POST':
+            return path, json.dumps(make_recipe(data, rng))
+        return path, None
+
+
+def make_recipe(data, rng):
+    return {
+        'name': f'Бенчмарк {rng.randrange(10 ** 9)}',
+        'text': 'Смешать и подать.',
+        'cooking_time': rng.randint(5, 120),
+        'tags': rng.sample(data['tags'], min(2, len(data['tags']))),
+        'ingredients': [
+            {'id': pk, 'amount': rng.randint(1, 500)}
+            for pk in rng.sample(data['ingredients'], 5)
+        ],
+    }
+
+
+SCENARIOS = (
+    Scenario(
+        'list',
+        'RecipeViewSet.list',
+        lambda data, rng: f'/api/recipes/?page={rng.randint(1, 5)}',
+    ),
+    Scenario(
+        'detail',
+        'RecipeViewSet.retrieve',
+        lambda data, rng: f"/api/recipes/{rng.choice(data['recipes'])}/",
+    ),
+    Scenario(
+        'feed',
+        'RecipeViewSet.feed',
+        lambda data, rng: (
+            f"/api/recipes/feed/?tags={rng.choice(data['slugs'])}"
+        ),
+        auth=True,
+    ),
+    Scenario(
+        'subscriptions',
+        'CustomUserViewSet.subscriptions',
+        '/api/users/subscriptions/?recipes_limit=3',
+        auth=True,
+    ),
+    Scenario(
+        'download_cart',
+        'RecipeViewSet.download_shopping_cart',
+        '/api/recipes/download_shopping_cart/',
+        auth=True,
+    ),
+    Scenario(
+        'create',
+        'RecipeViewSet.create',
+        '/api/recipes/',
+        method='POST',
+        auth=True,
+    ),
+)
+
+
+def get_endpoint_totals(endpoint):
+    with registry.lock:
+        stats = registry.endpoints.get(endpoint)
+        if stats is None:
+            return 0, 0
+        return sum(stats.requests.values()), stats.queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет сценарии нагрузки через API на локальном сервере '
+        'и выводит результаты в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios', nargs='+',
+            choices=[scenario.name for scenario in SCENARIOS],
+            default=[scenario.name for scenario in SCENARIOS],
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--user',
+            help='Почта пользователя для авторизованных сценариев.',
+        )
+        parser.add_argument('--output', help='Файл для JSON-отчёта.')
+
+    def handle(self, *args, **options):
+        data = self.get_data()
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Token {token.key}',
+        }
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        server.set_app(get_wsgi_application())
+        self.port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.created = []
+        try:
+            results = {
+                scenario.name: self.run(scenario, data, options)
+                for scenario in SCENARIOS
+                if scenario.name in options['scenarios']
+            }
+        finally:
+            self.cleanup()
+            server.shutdown()
+            server.server_close()
+        report = json.dumps(
+            {
+                'meta': {
+                    'started': datetime.now(timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': settings.DATABASES['default']['ENGINE'],
+                    'debug': settings.DEBUG,
+                    'seed': options['seed'],
+                    'requests': options['requests'],
+                    'concurrency': options['concurrency'],
+                    'dataset': {
+                        'users': User.objects.count(),
+                        'recipes': len(data['recipes']),
+                        'tags': len(data['tags']),
+                        'ingredients': len(data['ingredients']),
+                    },
+                },
+                'scenarios': results,
+            },
+            ensure_ascii=False,
+            indent=2,
+            sort_keys=True,
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    def get_data(self):
+        data = {
+            'recipes': list(Recipe.objects.values_list('pk', flat=True)),
+            'tags': list(Tag.objects.values_list('pk', flat=True)),
+            'slugs': list(Tag.objects.values_list('slug', flat=True)),
+            'ingredients': list(
+                Ingredient.objects.values_list('pk', flat=True)[:1000]
+            ),
+        }
+        if not data['recipes'] or len(data['ingredients']) < 5:
+            raise CommandError(
+                'Недостаточно данных: сначала выполните generate_fake_data.'
+            )
+        return data
+
+    def get_user(self, email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {email} не найден.')
+        user = User.objects.annotate(
+            follows=Count('followers')
+        ).order_by('-follows', 'pk').first()
+        if user is None:
+            raise CommandError('Нет пользователей.')
+        return user
+
+    def run(self, scenario, data, options):
+        rng = random.Random(options['seed'])
+        self.send_many(scenario, data, rng, options['warmup'], 1)
+        requests_before, queries_before = get_endpoint_totals(
+            scenario.endpoint
+        )
+        started = monotonic()
+        results = self.send_many(
+            scenario, data, rng, options['requests'], options['concurrency']
+        )
+        elapsed = monotonic() - started
+        requests_after, queries_after = get_endpoint_totals(scenario.endpoint)
+        latencies = sorted(latency for latency, ok in results if ok)
+        handled = max(requests_after - requests_before, 1)
+        return {
+            'endpoint': scenario.endpoint,
+            'requests': len(results),
+            'errors': sum(not ok for _, ok in results),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'throughput_rps': round(len(results) / elapsed, 1),
+            'queries_per_request': round(
+                (queries_after - queries_before) / handled, 2
+            ),
+        }
+
+    def send_many(self, scenario, data, rng, count, concurrency):
+        requests = [scenario.request(data, rng) for _ in range(count)]
+        chunks = [requests[index::concurrency] for index in range(concurrency)]
+        with ThreadPoolExecutor(concurrency) as executor:
+            return [
+                result
+                for results in executor.map(
+                    lambda chunk: self.send_chunk(scenario, chunk), chunks
+                )
+                for result in results
+            ]
+
+    def send_chunk(self, scenario, requests):
+        connection = HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = self.headers if scenario.auth else {}
+        results = []
+        for path, body in requests:
+            started = monotonic()
+            try:
+                connection.request(
+                    scenario.method, path, body=body, headers=headers
+                )
+                response = connection.getresponse()
+                content = response.read()
+            except (HTTPException, OSError):
+                connection.close()
+                results.append((monotonic() - started, False))
+                continue
+            results.append((monotonic() - started, response.status < 400))
+            if scenario.method == 'POST' and response.status == 201:
+                self.created.append(json.loads(content)['id'])
+        connection.close()
+        return results
+
+    def cleanup(self):
+        connection = HTTPConnection('127.0.0.1', self.port, timeout=60)
+        for pk in self.created:
+            connection.request(
+                'DELETE', f'/api/recipes/{pk}/', headers=self.headers
+            )
+            connection.getresponse().read()
+        connection.close()
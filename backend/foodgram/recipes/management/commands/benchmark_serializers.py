@@ -0,0 +1,120 @@
+from statistics import median
+from time import perf_counter
+
+from api.fast_serializers import (IngredientFastSerializer,
+                                  RecipeFastSerializer, TagFastSerializer)
+from api.renderers import FastJSONRenderer
+from api.serializers import (IngredientSerializer, RecipeViewSerializer,
+                             TagSerializer)
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from recipes.cache import get_reference
+from recipes.models import Recipe
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+User = get_user_model()
+
+STAGES = ('fetch', 'serialize', 'render')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает сериализацию списков через DRF и быстрый путь '
+        'в пересчёте на 1000 строк.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument(
+            '--user',
+            help='Почта пользователя, от имени которого строятся списки.',
+        )
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = AnonymousUser()
+        if options['user']:
+            try:
+                request.user = User.objects.get(email=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {options['user']} не найден.")
+        self.context = {'request': request}
+        rows = options['rows']
+        recipes = Recipe.objects.with_related()
+        cases = (
+            (
+                'recipes',
+                lambda: list(recipes[:rows]),
+                RecipeViewSerializer,
+                lambda: list(recipes.prefetch_related(None)[:rows]),
+                RecipeFastSerializer,
+            ),
+            (
+                'ingredients',
+                lambda: list(get_reference('ingredients').values())[:rows],
+                IngredientSerializer,
+                lambda: list(get_reference('ingredients').values())[:rows],
+                IngredientFastSerializer,
+            ),
+            (
+                'tags',
+                lambda: list(get_reference('tags').values())[:rows],
+                TagSerializer,
+                lambda: list(get_reference('tags').values())[:rows],
+                TagFastSerializer,
+            ),
+        )
+        self.stdout.write(
+            f"{'список':<12}{'путь':<6}{'строк':>7}"
+            + ''.join(f'{stage:>11}' for stage in STAGES)
+            + f"{'всего':>11}{'ускорение':>11}"
+        )
+        for name, fetch, serializer, fast_fetch, fast_serializer in cases:
+            drf = self.measure(
+                fetch, serializer, JSONRenderer(), options['repeat']
+            )
+            fast = self.measure(
+                fast_fetch,
+                fast_serializer,
+                FastJSONRenderer(),
+                options['repeat'],
+            )
+            if drf['content'] != fast['content']:
+                self.stderr.write(f'{name}: ответы не совпадают')
+            for label, result in (('drf', drf), ('fast', fast)):
+                speedup = sum(drf['timings']) / max(sum(result['timings']), 1e-9)
+                self.stdout.write(
+                    f"{name:<12}{label:<6}{result['rows']:>7}"
+                    + ''.join(
+                        f'{timing:>9.2f}мс' for timing in result['timings']
+                    )
+                    + f"{sum(result['timings']):>9.2f}мс{speedup:>10.1f}x"
+                )
+
+    def measure(self, fetch, serializer_class, renderer, repeat):
+        timings = [[] for _ in STAGES]
+        for _ in range(repeat):
+            started = perf_counter()
+            objs = fetch()
+            fetched = perf_counter()
+            data = serializer_class(
+                objs, many=True, context=self.context
+            ).data
+            serialized = perf_counter()
+            content = renderer.render(data)
+            rendered = perf_counter()
+            for stage, duration in enumerate((
+                fetched - started,
+                serialized - fetched,
+                rendered - serialized,
+            )):
+                timings[stage].append(duration)
+        scale = 1000 * 1000 / max(len(objs), 1)
+        return {
+            'rows': len(objs),
+            'timings': [median(values) * scale for values in timings],
+            'content': content,
+        }
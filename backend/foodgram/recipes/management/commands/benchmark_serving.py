@@ -0,0 +1,172 @@
+import os
+import socket
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException
+from pathlib import Path
+from time import monotonic, sleep
+
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe
+
+PROJECT_DIR = Path(__file__).resolve().parents[3]
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/{id}/',
+    '/api/tags/',
+    '/api/ingredients/',
+)
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def get_rss(pid):
+    pids = {pid}
+    for entry in Path('/proc').iterdir():
+        try:
+            stat = (entry / 'stat').read_text()
+        except (OSError, ValueError):
+            continue
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            pids.add(int(entry.name))
+    total = 0
+    for child in pids:
+        try:
+            status = Path(f'/proc/{child}/status').read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith('VmRSS:'):
+                total += int(line.split()[1]) * 1024
+    return total or None
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность gunicorn в режимах WSGI и ASGI '
+        'на горячих GET-эндпоинтах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', nargs='+', default=['wsgi', 'asgi'],
+            choices=['wsgi', 'asgi'],
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Число воркеров gunicorn в каждом режиме.',
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--token', help='Токен для заголовка Authorization.')
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+
+    def handle(self, *args, **options):
+        recipe_id = Recipe.objects.values_list('pk', flat=True).first()
+        paths = [
+            path.format(id=recipe_id) for path in options['paths']
+            if recipe_id is not None or '{id}' not in path
+        ]
+        self.headers = {}
+        if options['token']:
+            self.headers['Authorization'] = f"Token {options['token']}"
+        self.stdout.write(
+            f"{'режим':<6}{'запр/с':>10}{'p50 мс':>10}{'p95 мс':>10}"
+            f"{'ошибок':>8}{'RSS МБ':>10}{'запр/с на 100 МБ':>18}"
+        )
+        for mode in options['modes']:
+            result = self.run_mode(mode, paths, options)
+            rps = result['requests'] / options['duration']
+            rss = result['rss'] and result['rss'] / 1024 / 1024
+            self.stdout.write(
+                f"{mode:<6}{rps:>10.1f}"
+                f"{result['p50'] * 1000:>10.1f}{result['p95'] * 1000:>10.1f}"
+                f"{result['errors']:>8}"
+                f"{rss or 0:>10.1f}"
+                f"{rps * 100 / rss if rss else 0:>18.1f}"
+            )
+
+    def run_mode(self, mode, paths, options):
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py'],
+            cwd=PROJECT_DIR,
+            env={
+                **os.environ,
+                'SERVER_MODE': mode,
+                'GUNICORN_WORKERS': str(options['workers']),
+                'GUNICORN_BIND': f"127.0.0.1:{options['port']}",
+            },
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_ready(server, options['port'])
+            self.load(paths, options, options['warmup'])
+            latencies, errors = self.load(paths, options, options['duration'])
+            return {
+                'requests': len(latencies),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'errors': errors,
+                'rss': get_rss(server.pid),
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+    def wait_ready(self, server, port):
+        deadline = monotonic() + 30
+        while monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn завершился при запуске.')
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                return
+            except OSError:
+                sleep(0.2)
+        raise CommandError('gunicorn не запустился за 30 секунд.')
+
+    def load(self, paths, options, duration):
+        deadline = monotonic() + duration
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(
+                lambda index: self.client(
+                    paths, options['port'], deadline, index
+                ),
+                range(options['concurrency']),
+            ))
+        latencies = sorted(
+            latency for client_latencies, _ in results
+            for latency in client_latencies
+        )
+        return latencies, sum(errors for _, errors in results)
+
+    def client(self, paths, port, deadline, index):
+        connection = HTTPConnection('127.0.0.1', port, timeout=30)
+        latencies = []
+        errors = 0
+        while monotonic() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            started = monotonic()
+            try:
+                connection.request('GET', path, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+            except (HTTPException, OSError):
+                errors += 1
+                connection.close()
+                continue
+            if response.status >= 400:
+                errors += 1
+            else:
+                latencies.append(monotonic() - started)
+        connection.close()
+        return latencies, errors
@@ -0,0 +1,29 @@
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.similarity import SimilarityJob
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие рецепты для изменённых рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать похожие рецепты для всех рецептов.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        job = SimilarityJob(
+            top_k=settings.SIMILAR_RECIPES_TOP_K,
+            max_share=settings.SIMILAR_RECIPES_MAX_SHARE,
+            batch_size=options['batch_size'],
+        )
+        updated = job.run(full=options['all'])
+        self.stdout.write(
+            f'Обновлено рецептов: {updated} за {monotonic() - started:.2f} с'
+        )
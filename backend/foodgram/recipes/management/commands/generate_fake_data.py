@@ -0,0 +1,215 @@
+import random
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, Tag, TagRecipe)
+
+User = get_user_model()
+
+WORDS = (
+    'нарезать', 'смешать', 'обжарить', 'запечь', 'посолить', 'добавить',
+    'перемешать', 'остудить', 'подать', 'варить', 'тушить', 'взбить',
+)
+DERIVED_COMMANDS = (
+    ('repair_counters',),
+    ('rebuild_shopping_totals',),
+    ('rebuild_feed',),
+    ('update_recipe_scores',),
+    ('compute_similar_recipes', '--all'),
+)
+
+
+def skewed(rng, items, exponent=3):
+    return items[int(len(items) * rng.random() ** exponent)]
+
+
+def sample_skewed(rng, items, count, exponent=3):
+    count = min(count, len(items))
+    result = {}
+    while len(result) < count:
+        item = skewed(rng, items, exponent)
+        result[item] = None
+    return list(result)
+
+
+class Command(BaseCommand):
+    help = 'Создаёт воспроизводимый набор тестовых данных для нагрузки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=8)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=(3, 12),
+            metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument(
+            '--tags-per-recipe', type=int, nargs=2, default=(1, 3),
+            metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='fake')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--skip-derived',
+            action='store_true',
+            help='Не пересчитывать счётчики, ленты, итоги и рейтинги.',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов: сначала выполните load_ingredients.'
+            )
+        started = monotonic()
+        with transaction.atomic():
+            tag_ids = self.create_tags(options['tags'], options['prefix'])
+            user_ids = self.create_users(options['users'], options['prefix'])
+            recipe_ids = self.create_recipes(
+                options['recipes'],
+                user_ids,
+                ingredient_ids,
+                tag_ids,
+                options,
+            )
+            self.create_links(
+                Favorite, user_ids, recipe_ids,
+                options['favorites_per_user'],
+            )
+            self.create_links(
+                ShoppingCart, user_ids, recipe_ids,
+                options['carts_per_user'],
+            )
+            self.create_follows(user_ids, options['follows_per_user'])
+        self.stdout.write(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)} '
+            f'за {monotonic() - started:.2f} с'
+        )
+        if not options['skip_derived']:
+            for command in DERIVED_COMMANDS:
+                call_command(*command, stdout=self.stdout)
+
+    def create_new(self, model, objs):
+        last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        return list(
+            model.objects.filter(pk__gt=last).order_by('pk').values_list(
+                'pk', flat=True
+            )
+        )
+
+    def create_tags(self, count, prefix):
+        for number in range(count):
+            Tag.objects.get_or_create(
+                slug=f'{prefix}-{number}',
+                defaults={
+                    'name': f'{prefix} {number}',
+                    'color': f'#{self.rng.randrange(0x1000000):06X}',
+                },
+            )
+        return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_users(self, count, prefix):
+        start = User.objects.filter(username__startswith=prefix).count()
+        password = make_password(prefix)
+        return self.create_new(User, [
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name=f'Имя {number}',
+                last_name=f'Фамилия {number}',
+                password=password,
+            )
+            for number in range(start, start + count)
+        ])
+
+    def create_recipes(self, count, user_ids, ingredient_ids, tag_ids,
+                       options):
+        rng = self.rng
+        authors = [skewed(rng, user_ids) for _ in range(count)]
+        recipe_ids = self.create_new(Recipe, [
+            Recipe(
+                author_id=author_id,
+                name=f'Рецепт {number}',
+                text=' '.join(rng.choices(WORDS, k=rng.randint(5, 40))),
+                cooking_time=rng.randint(5, 180),
+            )
+            for number, author_id in enumerate(authors)
+        ])
+        ingredients = []
+        tags = []
+        for recipe_id in recipe_ids:
+            ingredients += [
+                IngredientRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for ingredient_id in sample_skewed(
+                    rng,
+                    ingredient_ids,
+                    rng.randint(*options['ingredients_per_recipe']),
+                )
+            ]
+            tags += [
+                TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in rng.sample(
+                    tag_ids,
+                    min(len(tag_ids),
+                        rng.randint(*options['tags_per_recipe'])),
+                )
+            ]
+        IngredientRecipe.objects.bulk_create(
+            ingredients, batch_size=self.batch_size
+        )
+        TagRecipe.objects.bulk_create(tags, batch_size=self.batch_size)
+        return recipe_ids
+
+    def create_links(self, model, user_ids, recipe_ids, average):
+        if not recipe_ids:
+            return
+        model.objects.bulk_create(
+            (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in sample_skewed(
+                    self.rng, recipe_ids, self.rng.randint(0, average * 2)
+                )
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def create_follows(self, user_ids, average):
+        authors = list(
+            Recipe.objects.filter(author__in=user_ids).values_list(
+                'author_id', flat=True
+            ).distinct().order_by('author_id')
+        )
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in sample_skewed(
+                    self.rng, authors, self.rng.randint(0, average * 2)
+                )
+                if author_id != user_id
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,147 @@
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.cache import bump_version
+from recipes.models import Ingredient
+
+READ_CHUNK_SIZE = 64 * 1024
+STAGING_TABLE = 'ingredient_import'
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[], \r\n\t':
+                position += 1
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            return
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def unique_rows(rows):
+    seen = set()
+    for name, unit in rows:
+        key = (name.strip(), unit.strip())
+        if key[0] and key not in seen:
+            seen.add(key)
+            yield key
+
+
+class CopySource:
+    def __init__(self, rows):
+        self.lines = self.serialize(rows)
+        self.buffer = ''
+        self.count = 0
+
+    def serialize(self, rows):
+        for name, unit in rows:
+            self.count += 1
+            yield '"{}","{}"\n'.format(
+                name.replace('"', '""'), unit.replace('"', '""')
+            )
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к .csv или .json файлу.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только .csv и .json файлы.')
+        started = monotonic()
+        with open(path, encoding='utf-8') as file:
+            rows = unique_rows(reader(file))
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    total, created = self.copy(rows)
+                else:
+                    total, created = self.bulk_create(
+                        rows, options['batch_size']
+                    )
+                transaction.on_commit(lambda: bump_version('ingredients'))
+        elapsed = monotonic() - started
+        self.stdout.write(
+            f'Прочитано {total}, добавлено {created} ингредиентов '
+            f'за {elapsed:.2f} с ({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
+    def bulk_create(self, rows, batch_size):
+        total = 0
+        before = Ingredient.objects.count()
+        while True:
+            batch = [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+        return total, Ingredient.objects.count() - before
+
+    def copy(self, rows):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        source = CopySource(rows)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {STAGING_TABLE} ('
+                f'name varchar({NAME_LENGTH}), '
+                f'measurement_unit varchar({UNIT_LENGTH})'
+                f') ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                f'COPY {STAGING_TABLE} (name, measurement_unit) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                source,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM {STAGING_TABLE} '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return source.count, cursor.rowcount
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает изображения рецептов, у которых нет миниатюр.'
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(
+            Q(image__isnull=True) | Q(image='')
+        ).filter(
+            Q(image_thumb__isnull=True) | Q(image_thumb='')
+        ).order_by('pk').values_list('pk', 'image')
+        processed = failed = 0
+        for recipe_id, name in recipes.iterator():
+            try:
+                process_recipe_image(recipe_id, name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+            else:
+                processed += 1
+        self.stdout.write(
+            f'Обработано изображений: {processed}, ошибок: {failed}'
+        )
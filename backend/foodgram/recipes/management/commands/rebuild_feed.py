@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import FeedEntry, Follow
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает ленты подписок всех пользователей.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            FeedEntry.objects.all().delete()
+            follows = Follow.objects.values_list('user_id', 'author_id')
+            for user_id, author_id in follows.iterator():
+                FeedEntry.backfill(user_id, author_id)
+        self.stdout.write(
+            f'Записей в лентах: {FeedEntry.objects.count()}'
+        )
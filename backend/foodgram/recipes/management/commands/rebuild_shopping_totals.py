@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from recipes.models import ShoppingTotal
+
+
+class Command(BaseCommand):
+    help = 'Сверяет итоги списков покупок с корзинами и исправляет их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        drift = ShoppingTotal.rebuild(
+            options['check'], options['batch_size']
+        )
+        self.stdout.write(
+            'Неверных итогов: {}, лишних: {}, недостающих: {}'.format(*drift)
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from recipes.counters import repair_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики рецептов и пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for counter, drift in repair_counters(
+            options['dry_run'], options['batch_size']
+        ):
+            self.stdout.write(f'{counter}: расхождений {drift}')
@@ -0,0 +1,72 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+ACTIVITY_WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 2.0),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает популярность и рейтинг трендов рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.today = timezone.localdate()
+        self.since = timezone.now() - timedelta(
+            days=settings.RECIPE_SCORE_WINDOW_DAYS
+        )
+        recipes = Recipe.objects.order_by('pk').values_list(
+            'pk', 'popularity', 'trending_score'
+        ).iterator()
+        updated = 0
+        while True:
+            batch = list(islice(recipes, options['batch_size']))
+            if not batch:
+                break
+            updated += self.update_batch(batch)
+        self.stdout.write(f'Обновлено рецептов: {updated}')
+
+    def get_activity(self, recipe_ids):
+        activity = defaultdict(lambda: defaultdict(float))
+        for model, weight in ACTIVITY_WEIGHTS:
+            buckets = model.objects.filter(
+                recipe_id__in=recipe_ids, created__gte=self.since
+            ).values_list(
+                'recipe_id', TruncDate('created')
+            ).annotate(total=Count('pk')).order_by()
+            for recipe_id, day, total in buckets:
+                activity[recipe_id][day] += weight * total
+        return activity
+
+    def decay(self, days, half_life):
+        return sum(
+            value * 0.5 ** ((self.today - day).days / half_life)
+            for day, value in days.items()
+        )
+
+    def update_batch(self, batch):
+        activity = self.get_activity([pk for pk, *_ in batch])
+        objs = []
+        for pk, popularity, trending_score in batch:
+            days = activity.get(pk, {})
+            scores = (
+                self.decay(days, settings.POPULARITY_HALF_LIFE_DAYS),
+                self.decay(days, settings.TRENDING_HALF_LIFE_DAYS),
+            )
+            if scores != (popularity, trending_score):
+                objs.append(Recipe(
+                    pk=pk, popularity=scores[0], trending_score=scores[1]
+                ))
+        Recipe.objects.bulk_update(objs, ['popularity', 'trending_score'])
+        return len(objs)
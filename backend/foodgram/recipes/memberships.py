@@ -0,0 +1,118 @@
+from array import array
+from bisect import bisect_left
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import CharField, Count, Max, Sum, Value
+from django.utils.functional import cached_property
+
+from .models import Favorite, Follow, ShoppingCart
+
+MEMBERSHIP_KEY = 'memberships:{}:{}'
+KINDS = {
+    'favorites': (Favorite, 'recipe_id'),
+    'cart': (ShoppingCart, 'recipe_id'),
+    'follows': (Follow, 'author_id'),
+}
+
+
+class IntegerSet:
+    def __init__(self, values=None):
+        self.values = values if values is not None else array('q')
+
+    def __contains__(self, value):
+        position = bisect_left(self.values, value)
+        return (
+            position < len(self.values) and self.values[position] == value
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+
+EMPTY = IntegerSet()
+
+
+def get_membership_state(user_id):
+    querysets = [
+        model.objects.using(DEFAULT_DB_ALIAS).filter(
+            user_id=user_id
+        ).values('user_id').annotate(
+            kind=Value(kind, output_field=CharField()),
+            count=Count('pk'),
+            total=Sum('pk'),
+            last=Max('pk'),
+        ).values_list('kind', 'count', 'total', 'last')
+        for kind, (model, _) in KINDS.items()
+    ]
+    return sorted(querysets[0].union(*querysets[1:], all=True))
+
+
+class Memberships:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.sets = None
+
+    @cached_property
+    def state(self):
+        return get_membership_state(self.user_id)
+
+    @cached_property
+    def key(self):
+        return MEMBERSHIP_KEY.format(
+            self.user_id, sha256(repr(self.state).encode()).hexdigest()
+        )
+
+    def __getitem__(self, kind):
+        if self.sets is None:
+            self.sets = {
+                kind: IntegerSet(values)
+                for kind, values in self.load().items()
+            }
+        return self.sets[kind]
+
+    def load(self):
+        values = cache.get(self.key)
+        if values is not None:
+            return values
+        values = {kind: array('q') for kind in KINDS}
+        querysets = [
+            model.objects.using(DEFAULT_DB_ALIAS).filter(
+                user_id=self.user_id
+            ).annotate(
+                kind=Value(kind, output_field=CharField())
+            ).values_list(field, 'kind')
+            for kind, (model, field) in KINDS.items()
+        ]
+        for pk, kind in querysets[0].union(*querysets[1:], all=True):
+            values[kind].append(pk)
+        for members in values.values():
+            members[:] = array('q', sorted(members))
+        cache.set(self.key, values, settings.MEMBERSHIP_CACHE_TIMEOUT)
+        return values
+
+
+class NoMemberships:
+    state = None
+
+    def __getitem__(self, kind):
+        return EMPTY
+
+
+def get_memberships(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return NoMemberships()
+    memberships = getattr(request, 'memberships', None)
+    if memberships is None or memberships.user_id != user.pk:
+        request.memberships = Memberships(user.pk)
+    return request.memberships
+
+
+def memberships_changed(request):
+    memberships = getattr(request, 'memberships', None)
+    request.memberships = None
+    if memberships is not None and 'key' in vars(memberships):
+        transaction.on_commit(lambda: cache.delete(memberships.key))
@@ -1,7 +1,13 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum
+from django.db.models.functions import Greatest
 
 User = get_user_model()
 
@@ -42,11 +48,39 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            )
+        ]
 
     def __str__(self):
         return f'{self.id}, {self.name}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self, fields=None):
+        lookups = {
+            'tags': Prefetch('tag', queryset=Tag.objects.order_by('pk')),
+            'ingredients': Prefetch(
+                'recipes',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+        }
+        queryset = self.prefetch_related(*(
+            lookup for name, lookup in lookups.items()
+            if fields is None or name in fields
+        ))
+        if fields is None or 'author' in fields:
+            queryset = queryset.select_related('author')
+        if fields is not None and 'text' not in fields:
+            return queryset.defer('text')
+        return queryset
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -57,7 +91,13 @@ class Recipe(models.Model):
     name = models.CharField('Название', max_length=200)
     image = models.ImageField(
         'Фото',
-        upload_to='recipes/images/',
+        upload_to='recipes/uploads/',
+        null=True,
+        default=None,
+    )
+    image_thumb = models.ImageField(
+        'Миниатюра',
+        upload_to='recipes/thumbs/',
         null=True,
         default=None,
     )
@@ -67,6 +107,26 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1)],
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+    )
+    shopping_count = models.PositiveIntegerField(
+        'Добавлений в списки покупок',
+        default=0,
+    )
+    popularity = models.FloatField('Популярность', default=0)
+    trending_score = models.FloatField('Рейтинг трендов', default=0)
+    similar_stale = models.BooleanField(
+        'Похожие рецепты устарели',
+        default=True,
+        db_index=True,
+    )
     ingredient = models.ManyToManyField(
         Ingredient,
         through='IngredientRecipe',
@@ -78,14 +138,36 @@ class Recipe(models.Model):
         verbose_name='Тэги',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('-popularity', '-id'),
+                name='recipe_popularity_id_idx',
+            ),
+            models.Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def changed(cls, objs, delta):
+        User.objects.filter(id__in=[obj.author_id for obj in objs]).update(
+            recipes_count=Greatest(F('recipes_count') + delta, 0)
+        )
+
 
 class TagRecipe(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
@@ -140,6 +222,11 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -153,6 +240,12 @@ class Favorite(models.Model):
     def __str__(self):
         return f'{self.user} - {self.recipe}'
 
+    @classmethod
+    def changed(cls, objs, delta):
+        Recipe.objects.filter(id__in=[obj.recipe_id for obj in objs]).update(
+            favorites_count=Greatest(F('favorites_count') + delta, 0)
+        )
+
 
 class ShoppingCart(models.Model):
     user = models.ForeignKey(
@@ -167,6 +260,11 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -180,6 +278,151 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return f'{self.user} - {self.recipe}'
 
+    @classmethod
+    def changed(cls, objs, delta):
+        Recipe.objects.filter(id__in=[obj.recipe_id for obj in objs]).update(
+            shopping_count=Greatest(F('shopping_count') + delta, 0)
+        )
+        ShoppingTotal.cart_changed(objs, delta)
+
+
+class ShoppingTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_totals',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_shopping_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+    @classmethod
+    def apply(cls, deltas):
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        stored = {
+            (row.user_id, row.ingredient_id): row
+            for row in cls.objects.select_for_update().filter(
+                user_id__in={user_id for user_id, _ in deltas},
+                ingredient_id__in={pk for _, pk in deltas},
+            )
+        }
+        changed, removed, added = [], [], []
+        for (user_id, ingredient_id), delta in deltas.items():
+            row = stored.get((user_id, ingredient_id))
+            if row is None:
+                added.append(cls(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=delta,
+                ))
+                continue
+            row.amount += delta
+            (changed if row.amount > 0 else removed).append(row)
+        cls.save_changes(
+            changed,
+            [row.pk for row in removed],
+            [row for row in added if row.amount > 0],
+        )
+
+    @classmethod
+    def save_changes(cls, changed, removed, added):
+        batch_size = settings.SHOPPING_TOTAL_BATCH_SIZE
+        if changed:
+            cls.objects.bulk_update(changed, ['amount'], batch_size=batch_size)
+        if removed:
+            cls.objects.filter(pk__in=removed).delete()
+        if added:
+            cls.objects.bulk_create(added, batch_size=batch_size)
+
+    @classmethod
+    def compare(cls, user_ids):
+        totals = IngredientRecipe.objects.filter(
+            recipe__shoppings__user_id__in=user_ids
+        ).values_list(
+            'recipe__shoppings__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by()
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in totals
+        }
+        changed, removed = [], []
+        stored = cls.objects.select_for_update().filter(user_id__in=user_ids)
+        for row in stored:
+            amount = actual.pop((row.user_id, row.ingredient_id), None)
+            if amount is None:
+                removed.append(row.pk)
+            elif amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        added = [
+            cls(user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+            for (user_id, ingredient_id), amount in actual.items()
+        ]
+        return changed, removed, added
+
+    @classmethod
+    def rebuild(cls, check=False, batch_size=1000):
+        users = User.objects.order_by('pk').values_list('pk', flat=True)
+        users = users.iterator()
+        drift = [0, 0, 0]
+        while True:
+            user_ids = list(islice(users, batch_size))
+            if not user_ids:
+                return drift
+            with transaction.atomic():
+                changed, removed, added = cls.compare(user_ids)
+                if not check:
+                    cls.save_changes(changed, removed, added)
+            drift[0] += len(changed)
+            drift[1] += len(removed)
+            drift[2] += len(added)
+
+    @classmethod
+    def cart_changed(cls, objs, delta):
+        ingredients = defaultdict(list)
+        rows = IngredientRecipe.objects.filter(
+            recipe_id__in={obj.recipe_id for obj in objs}
+        ).values_list('recipe_id', 'ingredient_id', 'amount')
+        for recipe_id, ingredient_id, amount in rows:
+            ingredients[recipe_id].append((ingredient_id, amount))
+        deltas = defaultdict(int)
+        for obj in objs:
+            for ingredient_id, amount in ingredients[obj.recipe_id]:
+                deltas[obj.user_id, ingredient_id] += delta * amount
+        cls.apply(deltas)
+
+    @classmethod
+    def recipe_changed(cls, recipe_id, changes):
+        if not changes:
+            return
+        users = ShoppingCart.objects.filter(
+            recipe=recipe_id
+        ).values_list('user_id', flat=True)
+        cls.apply({
+            (user_id, ingredient_id): delta
+            for user_id in users
+            for ingredient_id, delta in changes.items()
+        })
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -210,3 +453,186 @@ class Follow(models.Model):
     def clean(self):
         if self.user == self.author:
             raise ValidationError('Нельзя подписаться на самого себя')
+
+    @classmethod
+    def changed(cls, objs, delta):
+        User.objects.filter(id__in=[obj.author_id for obj in objs]).update(
+            followers_count=Greatest(F('followers_count') + delta, 0)
+        )
+        for obj in objs:
+            if delta > 0:
+                FeedEntry.backfill(obj.user_id, obj.author_id)
+            else:
+                FeedEntry.objects.filter(
+                    user=obj.user_id, author=obj.author_id
+                ).delete()
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', 'author', '-pub_date'),
+                name='feed_user_author_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+    @classmethod
+    def fan_out(cls, recipe):
+        followers = Follow.objects.filter(
+            author=recipe.author_id
+        ).values_list('user_id', flat=True)
+        cls.objects.bulk_create(
+            (
+                cls(
+                    user_id=user_id,
+                    recipe=recipe,
+                    author_id=recipe.author_id,
+                    pub_date=recipe.pub_date,
+                )
+                for user_id in followers.iterator()
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def backfill(cls, user_id, author_id):
+        recipes = Recipe.objects.filter(
+            author=author_id
+        ).order_by('-pub_date', '-id').values_list('id', 'pub_date')
+        cls.objects.bulk_create(
+            [
+                cls(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for recipe_id, pub_date in (
+                    recipes[:settings.FEED_BACKFILL_SIZE]
+                )
+            ],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def latest_by_author(cls, user, authors, limit=None):
+        if not authors:
+            return {}
+        result = {author.pk: [] for author in authors}
+        if limit is not None and limit <= settings.FEED_BACKFILL_SIZE:
+            cls.rank_recipes(result, list(result), limit, user)
+            authors = [
+                author for author in authors
+                if len(result[author.pk]) < min(limit, author.recipes_count)
+            ]
+        if authors:
+            cls.rank_recipes(result, [author.pk for author in authors], limit)
+        return result
+
+    @classmethod
+    def rank_recipes(cls, result, author_ids, limit, user=None):
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        if user is not None:
+            table, recipe_id = cls._meta.db_table, 'recipe_id'
+            user_clause, params = 'user_id = %s AND ', [user.pk]
+        else:
+            table, recipe_id = Recipe._meta.db_table, 'id'
+            user_clause, params = '', []
+        limit_clause = (
+            'WHERE latest.recipe_rank <= %s' if limit is not None else ''
+        )
+        recipes = Recipe.objects.raw(
+            f'SELECT recipe.* FROM ('
+            f'SELECT {recipe_id} AS recipe_id, ROW_NUMBER() OVER ('
+            f'PARTITION BY author_id ORDER BY pub_date DESC, {recipe_id} DESC'
+            f') AS recipe_rank FROM {quote(table)} '
+            f'WHERE {user_clause}author_id IN ({placeholders})'
+            f') AS latest '
+            f'JOIN {quote(Recipe._meta.db_table)} AS recipe '
+            f'ON recipe.id = latest.recipe_id {limit_clause} '
+            f'ORDER BY recipe.pub_date DESC, recipe.id DESC',
+            [*params, *author_ids, *([limit] if limit is not None else [])],
+        )
+        for author_id in author_ids:
+            result[author_id] = []
+        for recipe in recipes:
+            result[recipe.author_id].append(recipe)
+
+    @classmethod
+    def backfill_missing(cls):
+        follows = Follow.objects.filter(
+            author__recipes__isnull=False
+        ).exclude(
+            Exists(cls.objects.filter(
+                user=OuterRef('user_id'), author=OuterRef('author_id')
+            ))
+        ).values_list('user_id', 'author_id').distinct()
+        for user_id, author_id in follows.iterator():
+            cls.backfill(user_id, author_id)
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}: {self.score:.2f}'
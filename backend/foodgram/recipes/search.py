@@ -0,0 +1,110 @@
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+from .cache import get_reference
+from .models import Ingredient
+
+PREFIX, CONTAINS, SIMILAR = range(3)
+SIMILARITY_THRESHOLD = 0.3
+MAX_RESULTS = 500
+WORD_RE = re.compile(r'\w+')
+
+SEARCH_INDEXES_SQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_lower_idx '
+    'ON {table} (lower(name) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+    'ON {table} USING gin (lower(name) gin_trgm_ops)',
+)
+
+
+def trigrams(text):
+    result = set()
+    for word in WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        result.update(
+            padded[index:index + 3] for index in range(len(padded) - 2)
+        )
+    return result
+
+
+def similarity(first, second):
+    first, second = trigrams(first), trigrams(second)
+    if not first or not second:
+        return 0
+    return len(first & second) / len(first | second)
+
+
+def search_ingredients(queryset, query):
+    query = query.strip().lower()
+    if not query:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        return search_in_database(queryset, query)
+    return search_in_process(queryset, query)
+
+
+def search_in_database(queryset, query):
+    return queryset.annotate(
+        lower_name=Lower('name'),
+    ).filter(
+        Q(lower_name__startswith=query)
+        | Q(lower_name__contains=query)
+        | Q(lower_name__trigram_similar=query)
+    ).annotate(
+        rank=Case(
+            When(lower_name__startswith=query, then=Value(PREFIX)),
+            When(lower_name__contains=query, then=Value(CONTAINS)),
+            default=Value(SIMILAR),
+            output_field=IntegerField(),
+        ),
+        similarity=TrigramSimilarity(Lower('name'), query),
+    ).order_by('rank', '-similarity', 'name')
+
+
+def rank_ingredients(ingredients, query):
+    ranked = []
+    for pk, name in ingredients:
+        name = name.lower()
+        if name.startswith(query):
+            ranked.append((PREFIX, 0, name, pk))
+            continue
+        if query in name:
+            ranked.append((CONTAINS, 0, name, pk))
+            continue
+        score = similarity(query, name)
+        if score >= SIMILARITY_THRESHOLD:
+            ranked.append((SIMILAR, -score, name, pk))
+    ranked.sort()
+    return [pk for *_, pk in ranked[:MAX_RESULTS]]
+
+
+def search_in_process(queryset, query):
+    ids = rank_ingredients(
+        (
+            (pk, ingredient.name)
+            for pk, ingredient in get_reference('ingredients').items()
+        ),
+        query,
+    )
+    return queryset.filter(pk__in=ids).order_by(
+        Case(
+            *[When(pk=pk, then=Value(position))
+              for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    )
+
+
+def create_search_indexes(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    with connection.cursor() as cursor:
+        for sql in SEARCH_INDEXES_SQL:
+            cursor.execute(sql.format(table=table))
@@ -0,0 +1,88 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_version
+from .counters import repair_counters
+from .index import index
+from .models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
+                     ShoppingCart, ShoppingTotal, Tag)
+
+COUNTED_MODELS = (Recipe, Favorite, ShoppingCart, Follow)
+
+pending_changes = ContextVar('pending_changes', default=None)
+
+
+@contextmanager
+def deferred_changes():
+    pending = defaultdict(list)
+    token = pending_changes.set(pending)
+    try:
+        yield
+    finally:
+        pending_changes.reset(token)
+    for (model, delta), objs in pending.items():
+        model.changed(objs, delta)
+
+
+def record_change(model, obj, delta):
+    pending = pending_changes.get()
+    if pending is None:
+        model.changed([obj], delta)
+    else:
+        pending[model, delta].append(obj)
+
+
+def counted_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_change(sender, instance, 1)
+
+
+def counted_deleted(sender, instance, **kwargs):
+    record_change(sender, instance, -1)
+
+
+for model in COUNTED_MODELS:
+    post_save.connect(counted_saved, sender=model)
+    pre_delete.connect(counted_deleted, sender=model)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('ingredients'))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, **kwargs):
+    transaction.on_commit(index.mark_stale)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    Recipe.objects.filter(similar__similar=instance).update(
+        similar_stale=True
+    )
+
+
+def fill_counters(sender, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        repair_counters()
+
+
+def rebuild_shopping_totals(sender, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        ShoppingTotal.rebuild()
+
+
+def backfill_feeds(sender, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        FeedEntry.backfill_missing()
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from heapq import nlargest
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Min
+
+from .models import IngredientRecipe, Recipe, SimilarRecipe, TagRecipe
+
+
+def load_features():
+    features = defaultdict(set)
+    rows = IngredientRecipe.objects.values_list('recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in rows.iterator():
+        features[recipe_id].add(ingredient_id)
+    rows = TagRecipe.objects.values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in rows.iterator():
+        features[recipe_id].add(-tag_id)
+    postings = defaultdict(list)
+    for recipe_id, recipe_features in features.items():
+        for feature in recipe_features:
+            postings[feature].append(recipe_id)
+    return features, postings
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class SimilarityJob:
+    def __init__(self, top_k, max_share, batch_size):
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.features, self.postings = load_features()
+        self.max_posting = max(1, int(len(self.features) * max_share))
+        self.neighbours = {}
+
+    def scores(self, recipe_id):
+        features = self.features.get(recipe_id, set())
+        rare = [
+            feature for feature in features
+            if len(self.postings[feature]) <= self.max_posting
+        ] or features
+        candidates = set()
+        for feature in rare:
+            candidates.update(self.postings[feature])
+        candidates.discard(recipe_id)
+        result = {}
+        for other in candidates:
+            shared = len(features & self.features[other])
+            total = len(features) + len(self.features[other]) - shared
+            result[other] = shared / total
+        return result
+
+    def get_neighbours(self, recipe_id, scores=None):
+        if recipe_id not in self.neighbours:
+            if scores is None:
+                scores = self.scores(recipe_id)
+            self.neighbours[recipe_id] = nlargest(
+                self.top_k,
+                scores.items(),
+                key=lambda item: (item[1], -item[0]),
+            )
+        return self.neighbours[recipe_id]
+
+    def affected(self, stale):
+        thresholds = {
+            recipe_id: (count, lowest)
+            for recipe_id, count, lowest in SimilarRecipe.objects.values(
+                'recipe_id'
+            ).annotate(
+                count=Count('pk'), lowest=Min('score')
+            ).values_list('recipe_id', 'count', 'lowest').order_by()
+        }
+        result = set(stale)
+        for chunk in chunks(stale, self.batch_size):
+            result.update(
+                SimilarRecipe.objects.filter(
+                    similar_id__in=chunk
+                ).values_list('recipe_id', flat=True)
+            )
+        for recipe_id in stale:
+            scores = self.scores(recipe_id)
+            self.get_neighbours(recipe_id, scores)
+            for other, score in scores.items():
+                count, lowest = thresholds.get(other, (0, 0))
+                if count < self.top_k or score > lowest:
+                    result.add(other)
+        return result
+
+    def run(self, full=False):
+        stale = list(
+            Recipe.objects.filter(similar_stale=True).values_list(
+                'pk', flat=True
+            )
+        )
+        if full or len(stale) * 2 > len(self.features):
+            recipe_ids = set(stale) | self.features.keys()
+        else:
+            recipe_ids = self.affected(stale)
+        for chunk in chunks(sorted(recipe_ids), self.batch_size):
+            self.save(chunk)
+        return len(recipe_ids)
+
+    def save(self, recipe_ids):
+        objs = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=other, score=score)
+            for recipe_id in recipe_ids
+            for other, score in self.get_neighbours(recipe_id)
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+            SimilarRecipe.objects.bulk_create(objs)
+            Recipe.objects.filter(pk__in=recipe_ids).update(
+                similar_stale=False
+            )
+        for recipe_id in recipe_ids:
+            self.neighbours.pop(recipe_id, None)